@@ -0,0 +1,148 @@
+import json
+
+from flask import request
+from marshmallow import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+
+from extension import db
+
+
+def iter_request_records():
+    """
+    Yield ``(index, record, error)`` for each record of the body, a JSON array (or a single
+    object) or, with the ``application/x-ndjson`` content type, one JSON object per line read
+    from the stream without buffering the whole body.
+    """
+    if request.mimetype == "application/x-ndjson":
+        index = 0
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield index, json.loads(line), None
+            except ValueError as e:
+                yield index, None, {"_schema": [f"invalid JSON: {str(e)}"]}
+            index += 1
+        return
+
+    body = request.get_json()
+    if isinstance(body, dict):
+        body = [body]
+    if not isinstance(body, list):
+        raise ValueError("body must be a JSON array or NDJSON")
+    for index, record in enumerate(body):
+        yield index, record, None
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def grouped_by_keys(rows):
+    """
+    ``rows`` split into lists sharing the same keys, in order of first appearance: an
+    executemany statement only has the columns of its first row
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(frozenset(row), []).append(row)
+    return list(groups.values())
+
+
+def upsert_statement(table):
+    """
+    INSERT statement replacing rows whose primary key already exists, None if the dialect
+    has no such statement.
+    """
+    dialect = db.session.get_bind().dialect.name
+    primary_key = [column.name for column in table.primary_key.columns]
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+
+        statement = insert(table)
+        update = {
+            column.name: statement.excluded[column.name]
+            for column in table.columns
+            if not column.primary_key
+        }
+        if not update:
+            return statement.on_conflict_do_nothing(index_elements=primary_key)
+        return statement.on_conflict_do_update(index_elements=primary_key, set_=update)
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+
+        statement = insert(table)
+        update = {
+            column.name: statement.inserted[column.name]
+            for column in table.columns
+            if not column.primary_key
+        } or {primary_key[0]: statement.inserted[primary_key[0]]}
+        return statement.on_duplicate_key_update(**update)
+    if dialect == "sqlite":
+        return table.insert().prefix_with("OR REPLACE")
+    return None
+
+
+def bulk_write(table, schema, records, chunk_size, upsert=False):
+    """
+    Validate and write ``records`` (from ``iter_request_records``) chunk by chunk with
+    Core ``executemany`` statements, committing each chunk. A chunk the database rejects is
+    retried row by row so only the offending rows are reported.
+
+    :return: ``(written, errors)``, errors keyed by the index of the record in the body
+    """
+    statement = upsert_statement(table) if upsert else table.insert()
+    if statement is None:
+        raise ValueError(f"upsert is not supported on {db.session.get_bind().dialect.name}")
+
+    written = 0
+    errors = {}
+    for chunk in chunked(records, chunk_size):
+        indexes = []
+        data = []
+        for index, record, error in chunk:
+            if error is not None:
+                errors[index] = error
+            else:
+                indexes.append(index)
+                data.append(record)
+
+        try:
+            rows = schema.load(data)
+            invalid = {}
+        except ValidationError as e:
+            rows = e.valid_data
+            invalid = e.messages
+        valid = []
+        for position, row in enumerate(rows):
+            if position in invalid:
+                errors[indexes[position]] = invalid[position]
+            else:
+                valid.append((indexes[position], row))
+        if not valid:
+            continue
+
+        try:
+            for rows in grouped_by_keys(row for _, row in valid):
+                db.session.execute(statement, rows)
+            db.session.commit()
+            written += len(valid)
+        except SQLAlchemyError:
+            db.session.rollback()
+            for index, row in valid:
+                try:
+                    db.session.execute(statement, row)
+                    db.session.commit()
+                    written += 1
+                except SQLAlchemyError as e:
+                    db.session.rollback()
+                    errors[index] = {"_schema": [str(e.orig if hasattr(e, "orig") else e)]}
+    return written, errors
@@ -1,6 +1,22 @@
-from flask import jsonify
+from flask import current_app, request, stream_with_context, url_for
 from flask_restful import Resource
 
+from api.helpers import bulk_write, iter_request_records
+from api.schemas import DemoBulkSchema, DemoSchema
+from common.response import dumps
+from extension import db, response_cache
+from models.demo import Demo
+
+demo_schema = DemoSchema()
+demos_schema = DemoSchema(many=True)
+demos_bulk_schema = DemoBulkSchema(many=True)
+
+
+def wants_stream():
+    return request.args.get("format") == "ndjson" or (
+        request.accept_mimetypes.best == "application/x-ndjson"
+    )
+
 
 class DemoResource(Resource):
     """Creation and get_all
@@ -9,6 +25,23 @@ class DemoResource(Resource):
         get:
           tags:
             - demo
+          parameters:
+            - in: query
+              name: cursor
+              schema:
+                type: integer
+              description: next_cursor of the previous page, omit for the first page
+            - in: query
+              name: limit
+              schema:
+                type: integer
+              description: page size, capped by API_MAX_PAGE_SIZE
+            - in: query
+              name: format
+              schema:
+                type: string
+                enum: [ndjson]
+              description: stream every demo after the cursor, one JSON object per line
           responses:
             200:
               content:
@@ -21,30 +54,130 @@ class DemoResource(Resource):
                           results:
                             type: array
                             items:
-                              $ref: '#/components/schemas/UserSchema'
+                              $ref: '#/components/schemas/DemoSchema'
+                application/x-ndjson:
+                  schema:
+                    $ref: '#/components/schemas/DemoSchema'
         post:
           tags:
             - demo
+          parameters:
+            - in: query
+              name: mode
+              schema:
+                type: string
+                enum: [insert, upsert]
+              description: upsert replaces the demos whose demo_id already exists
+            - in: query
+              name: chunk_size
+              schema:
+                type: integer
+              description: rows written and committed per statement
           requestBody:
             content:
               application/json:
                 schema:
-                  DemoSchema
+                  type: array
+                  items: DemoSchema
+              application/x-ndjson:
+                schema: DemoSchema
           responses:
             201:
+              description: every demo was written
+              content:
+                application/json:
+                  schema:
+                    $ref: '#/components/schemas/BulkResult'
+            207:
+              description: some demos were rejected, see errors
               content:
                 application/json:
                   schema:
-                    type: object
-                    properties:
-                      msg:
-                        type: string
-                        example: user created
-                      user: DemoSchema
+                    $ref: '#/components/schemas/BulkResult'
+            400:
+              description: no demo could be written
         """
     
+    @response_cache.cached(tags=("demo",), unless=wants_stream)
     def get(self):
-        return 'hi', 200
+        """Keyset pagination on demo_id, pages never use OFFSET"""
+        cursor = request.args.get("cursor", type=int)
+        if wants_stream():
+            return self.stream(cursor)
+
+        limit = max(
+            1,
+            min(
+                request.args.get("limit", current_app.config["API_PAGE_SIZE"], type=int),
+                current_app.config["API_MAX_PAGE_SIZE"],
+            ),
+        )
+        query = Demo.query.order_by(Demo.demo_id)
+        if cursor is not None:
+            query = query.filter(Demo.demo_id > cursor)
+        demos = query.limit(limit + 1).all()
+
+        next_cursor = None
+        if len(demos) > limit:
+            demos = demos[:limit]
+            next_cursor = demos[-1].demo_id
+        return (
+            {
+                "results": demos_schema.dump(demos),
+                "next_cursor": next_cursor,
+                "next": url_for(
+                    ".demos", cursor=next_cursor, limit=limit, _external=True
+                ) if next_cursor is not None else None,
+            },
+            200,
+        )
+
+    @staticmethod
+    def stream(cursor):
+        """NDJSON of every demo after the cursor, read through a server-side cursor"""
+        batch_size = current_app.config["API_STREAM_BATCH_SIZE"]
+        query = (
+            db.session.query(Demo)
+            .order_by(Demo.demo_id)
+            .execution_options(stream_results=True)
+            .yield_per(batch_size)
+        )
+        if cursor is not None:
+            query = query.filter(Demo.demo_id > cursor)
+
+        def generate():
+            for demo in query:
+                yield dumps(demo_schema.dump(demo)) + b"\n"
+
+        return current_app.response_class(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
     
     def post(self):
-        pass
+        """Bulk insert or upsert, validated and written by chunks without ORM objects"""
+        chunk_size = min(
+            request.args.get(
+                "chunk_size", current_app.config["API_BULK_CHUNK_SIZE"], type=int
+            ),
+            current_app.config["API_BULK_MAX_CHUNK_SIZE"],
+        )
+        try:
+            written, errors = bulk_write(
+                Demo.__table__,
+                demos_bulk_schema,
+                iter_request_records(),
+                chunk_size=max(1, chunk_size),
+                upsert=request.args.get("mode") == "upsert",
+            )
+        except ValueError as e:
+            return {"message": e.args[0]}, 400
+
+        if written:
+            response_cache.invalidate("demo")
+        if not errors:
+            status = 201
+        elif written:
+            status = 207
+        else:
+            status = 400
+        return {"written": written, "failed": len(errors), "errors": errors}, status
@@ -1,3 +1,3 @@
-from api.schemas.demo import DemoSchema
+from api.schemas.demo import DemoSchema, DemoBulkSchema
 
-__all__ = ["DemoSchema"] 
+__all__ = ["DemoSchema", "DemoBulkSchema"]
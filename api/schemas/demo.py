@@ -8,3 +8,10 @@ class DemoSchema(ma.SQLAlchemyAutoSchema):
         model = Demo
         sqla_session = db.session
         load_instance = True
+
+
+class DemoBulkSchema(DemoSchema):
+    """Loads plain dicts, for bulk writes that do not go through the ORM"""
+
+    class Meta(DemoSchema.Meta):
+        load_instance = False
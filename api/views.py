@@ -1,4 +1,4 @@
-from flask import Blueprint, current_app, jsonify
+from flask import Blueprint, jsonify
 from flask_restful import Api
 from marshmallow import ValidationError
 
@@ -12,10 +12,34 @@ api = Api(blueprint)
 api.add_resource(DemoResource, "/demos", endpoint="demos")
 
 
-@blueprint.before_app_first_request
-def register_views():
+@blueprint.record_once
+def register_views(state):
     apispec.spec.components.schema("DemoSchema", schema=DemoSchema)
-    apispec.spec.path(view=DemoResource, app=current_app)
+    apispec.spec.components.schema(
+        "PaginatedResult",
+        {
+            "type": "object",
+            "properties": {
+                "next_cursor": {"type": "integer", "nullable": True},
+                "next": {"type": "string", "nullable": True},
+            },
+        },
+    )
+    apispec.spec.components.schema(
+        "BulkResult",
+        {
+            "type": "object",
+            "properties": {
+                "written": {"type": "integer"},
+                "failed": {"type": "integer"},
+                "errors": {
+                    "type": "object",
+                    "description": "validation or database errors by index of the record",
+                },
+            },
+        },
+    )
+    apispec.register_view(DemoResource, app=state.app)
 
 
 @blueprint.errorhandler(ValidationError)
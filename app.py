@@ -1,8 +1,6 @@
-from flask import Flask, jsonify
-from flask_restplus import Api, Resource
+import os
 
-import auth
-from extension import apispec, db, jwt
+from flask import Flask
 
 
 def configure_name(instance_name, app):
@@ -14,11 +12,47 @@ def configure_name(instance_name, app):
 
 
 def configure_extensions(app):
+    from auth.audit import audit_log
+    from auth.keys import key_ring
+    from extension import (
+        db,
+        hasher,
+        identity_cache,
+        jwt,
+        limiter,
+        metrics,
+        profiler,
+        response_cache,
+        revocation_cache,
+    )
+
+    metrics.init_app(app)
+    profiler.init_app(app)
     db.init_app(app)
     jwt.init_app(app)
+    key_ring.init_app(app)
+    revocation_cache.init_app(app)
+    identity_cache.init_app(app)
+    hasher.init_app(app)
+    limiter.init_app(app)
+    response_cache.init_app(app)
+    audit_log.init_app(app)
     
     
+def configure_proxy(app):
+    """Take the client address and scheme from the ``PROXY_COUNT`` proxies in front of the
+    app, the rate limits and audit trail would see the proxy's address otherwise"""
+    if app.config["PROXY_COUNT"]:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+
+        app.wsgi_app = ProxyFix(
+            app.wsgi_app, x_for=app.config["PROXY_COUNT"], x_proto=app.config["PROXY_COUNT"]
+        )
+
+
 def configure_apispec(app):
+    from extension import apispec
+
     apispec.init_app(app, security=[{"jwt": []}])
     apispec.spec.components.security_scheme(
         "jwt", {"type": "http", "scheme": "bearer", "bearerFormat": "JWT"}
@@ -33,14 +67,35 @@ def register_blueprints(app):
     :return: void
 
     """
+    import api.views
+    import auth.views
+
+    # userAPI is a placeholder and stays unregistered
     app.register_blueprint(auth.views.blueprint)
+    app.register_blueprint(api.views.blueprint)
+
+
+def create_app(config_name=None):
+    """
+    application factory, extensions and blueprints are only imported here so that importing
+    this module stays cheap
 
+    :param config_name: key of ``config.instances``, defaults to FLASK_CONFIG then FLASK_ENV
+    :return: the configured application
 
-app = Flask("common")
+    """
+    from extension import apispec
 
-app.config.from_object(configure_name('development', app))
+    config_name = (
+        config_name or os.getenv("FLASK_CONFIG") or os.getenv("FLASK_ENV") or "development"
+    )
+    app = Flask("common")
+    app.config.from_object(configure_name(config_name, app))
 
-configure_extensions(app)
-configure_apispec(app)
-register_blueprints(app)
-app.app_context().push()
+    configure_proxy(app)
+    configure_extensions(app)
+    configure_apispec(app)
+    register_blueprints(app)
+    # paths are registered with the blueprints, the document can be serialized right away
+    apispec.build()
+    return app
@@ -0,0 +1,148 @@
+import atexit
+import datetime
+import queue
+import threading
+import time
+
+from flask import has_request_context, request
+from sqlalchemy.exc import SQLAlchemyError
+
+from extension import db
+from common.process import PerProcess
+from models.audit_event import AuditEvent
+
+# put on the queue by ``drain`` to stop the flusher once it wrote the batch it holds
+_STOP = object()
+
+
+def fit(value, column):
+    """``value`` cut to the length of the String ``column``: one value too long for its
+    column would fail the insert of the whole batch"""
+    if value is None:
+        return None
+    return str(value)[: column.type.length]
+
+
+class AuditLog(object):
+    """Audit trail of the authentication events, written off the request path.
+
+    ``record`` only puts the event on a bounded in-process queue; a flusher thread
+    inserts the queued events with one executemany per batch, every
+    ``AUDIT_FLUSH_INTERVAL`` seconds or as soon as ``AUDIT_BATCH_SIZE`` are waiting. When
+    the queue holds ``AUDIT_QUEUE_SIZE`` events new ones are dropped and counted in
+    ``stats`` rather than slowing the requests down. What is still queued or held by the
+    flusher at exit is written by ``drain``.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._process = PerProcess(self._start_flusher)
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0, "failed": 0}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("AUDIT_ENABLED", True)
+        app.config.setdefault("AUDIT_QUEUE_SIZE", 10000)
+        app.config.setdefault("AUDIT_BATCH_SIZE", 500)
+        app.config.setdefault("AUDIT_FLUSH_INTERVAL", 1.0)
+        app.config.setdefault("AUDIT_DRAIN_TIMEOUT", 5.0)
+        if self.app is None:
+            atexit.register(self.drain)
+        self.app = app
+        app.extensions["audit"] = self
+
+    def record(self, event, success=True, user_id=None, username=None, detail=None):
+        if not self.app.config["AUDIT_ENABLED"]:
+            return
+        self._process.ensure()
+        row = {
+            "event": event,
+            "success": success,
+            "user_id": user_id,
+            "username": fit(username, AuditEvent.username),
+            "ip": fit(request.remote_addr, AuditEvent.ip) if has_request_context() else None,
+            "detail": fit(detail, AuditEvent.detail),
+            "created_on": datetime.datetime.utcnow(),
+        }
+        try:
+            self._queue.put_nowait(row)
+            self.stats["recorded"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def drain(self):
+        """Stop the flusher and write every pending event now, called at exit"""
+        events = self._queue
+        if events is None or not self._process.current:
+            return
+        timeout = self.app.config["AUDIT_DRAIN_TIMEOUT"]
+        thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            try:
+                events.put(_STOP, timeout=timeout)
+                thread.join(timeout)
+            except queue.Full:
+                pass
+
+        batch_size = self.app.config["AUDIT_BATCH_SIZE"]
+        while True:
+            batch = []
+            try:
+                while len(batch) < batch_size:
+                    event = events.get_nowait()
+                    if event is not _STOP:
+                        batch.append(event)
+            except queue.Empty:
+                pass
+            if not batch:
+                return
+            self._write(batch)
+
+    def _start_flusher(self):
+        self._queue = queue.Queue(maxsize=self.app.config["AUDIT_QUEUE_SIZE"])
+        self._thread = threading.Thread(target=self._flush, name="audit-log", daemon=True)
+        self._thread.start()
+
+    def _flush(self):
+        events = self._queue
+        batch_size = self.app.config["AUDIT_BATCH_SIZE"]
+        interval = self.app.config["AUDIT_FLUSH_INTERVAL"]
+        while True:
+            event = events.get()
+            if event is _STOP:
+                return
+            batch = [event]
+            deadline = time.monotonic() + interval
+            stop = False
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = events.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    stop = True
+                    break
+                batch.append(event)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(AuditEvent.__table__.insert(), batch)
+            self.stats["written"] += len(batch)
+        except SQLAlchemyError as e:
+            self.stats["failed"] += len(batch)
+            self.app.logger.error(f"could not write {len(batch)} audit events {str(e)}")
+
+
+audit_log = AuditLog()
@@ -1,11 +1,23 @@
+import threading
+import time
+
+import redis
+from flask import current_app as app
 from sqlalchemy.orm.exc import NoResultFound
 
+from extension import metrics, revocation_cache
 from models.redis_models.redis_model import (
-    get_redix_prefix_jwt_token,
+    CircuitOpenError,
+    get_redis_key_revoked_before,
     connect_with_redis,
     RedisModel,
 )
 
+# revocations which could not be written while Redis was unreachable, replayed once it
+# answers again: ("token", jti, exp) or ("user", user_id, revoked_before)
+_pending_lock = threading.Lock()
+_pending = []
+
 
 def add_token_to_database(encoded_token, identity_claim):
     pass
@@ -17,25 +29,202 @@ def is_token_revoked(decoded_token):
     tokens that we create into this database, if the token is not present
     in the database we are going to consider it revoked, as we don't know where
     it was created.
+
+    A token is also revoked when it was issued before the "revoked before" watermark
+    of its user, see ``revoke_all_tokens``.
+
+    When Redis is unreachable the answer comes from the revocations replicated to this
+    worker, tokens unknown to them follow ``REDIS_FAILURE_POLICY``.
     """
     jti = decoded_token["jti"]
+    user_id = decoded_token[app.config["JWT_IDENTITY_CLAIM"]]["id"]
+    if _pending:
+        replay_revocations()
+    revoked = revocation_cache.lookup(jti)
+    revoked_before = revocation_cache.lookup_revoked_before(user_id)
+    if revoked or (revoked_before and decoded_token["iat"] < revoked_before):
+        return True
+    if revoked is not None and revoked_before is not None:
+        return False
     try:
-        jti = get_redix_prefix_jwt_token() + jti
-        if connect_with_redis().exists(jti):
+        pipe = connect_with_redis().pipeline(transaction=False)
+        RedisModel.queue_is_revoked(pipe, jti, decoded_token["exp"])
+        pipe.hget(get_redis_key_revoked_before(), user_id)
+        with metrics.timer("redis", "is_token_revoked"):
+            exists, revoked_before = pipe.execute()
+        if exists:
+            return True
+        if revoked_before and decoded_token["iat"] < float(revoked_before):
             return True
     except NoResultFound:
         return True
+    except redis.RedisError as e:
+        if not isinstance(e, CircuitOpenError):
+            app.logger.warning(f"revocation check without Redis: {str(e)}")
+        if revocation_cache.is_revoked_locally(jti, user_id, decoded_token["iat"]):
+            return True
+        return app.config["REDIS_FAILURE_POLICY"] == "closed"
     return False
 
 
-def revoke_token(token_jti, token_name):
+def are_tokens_revoked(decoded_tokens):
+    """
+    ``is_token_revoked`` for many tokens, in order: what the revocation cache cannot
+    answer is checked with a single Redis pipeline.
+    """
+    identity_claim = app.config["JWT_IDENTITY_CLAIM"]
+    if _pending:
+        replay_revocations()
+    results = [None] * len(decoded_tokens)
+    unknown = []
+    for index, token in enumerate(decoded_tokens):
+        user_id = token[identity_claim]["id"]
+        revoked = revocation_cache.lookup(token["jti"])
+        revoked_before = revocation_cache.lookup_revoked_before(user_id)
+        if revoked or (revoked_before and token["iat"] < revoked_before):
+            results[index] = True
+        elif revoked is not None and revoked_before is not None:
+            results[index] = False
+        else:
+            unknown.append(index)
+    if not unknown:
+        return results
+
+    user_ids = list({decoded_tokens[index][identity_claim]["id"] for index in unknown})
+    try:
+        pipe = connect_with_redis().pipeline(transaction=False)
+        for index in unknown:
+            RedisModel.queue_is_revoked(
+                pipe, decoded_tokens[index]["jti"], decoded_tokens[index]["exp"]
+            )
+        pipe.hmget(get_redis_key_revoked_before(), user_ids)
+        with metrics.timer("redis", "are_tokens_revoked"):
+            replies = pipe.execute()
+    except redis.RedisError as e:
+        if not isinstance(e, CircuitOpenError):
+            app.logger.warning(f"revocation check without Redis: {str(e)}")
+        fail_closed = app.config["REDIS_FAILURE_POLICY"] == "closed"
+        for index in unknown:
+            token = decoded_tokens[index]
+            results[index] = fail_closed or revocation_cache.is_revoked_locally(
+                token["jti"], token[identity_claim]["id"], token["iat"]
+            )
+        return results
+
+    watermarks = dict(zip(user_ids, replies[-1]))
+    for index, exists in zip(unknown, replies):
+        token = decoded_tokens[index]
+        revoked_before = watermarks[token[identity_claim]["id"]]
+        results[index] = bool(exists) or bool(
+            revoked_before and token["iat"] < float(revoked_before)
+        )
+    return results
+
+
+def revoke_token(token_jti, token_name, expires):
     """Revokes the given token
 
     Since we use it only on logout that already require a valid access token,
     if token is not found we raise an exception
+
+    ``expires`` is the ``exp`` claim of the token, the other workers drop it from their
+    revocation cache once it is reached. It also picks the bucket of the revocation, an
+    estimate would file it where the token is never looked up.
+
+    If Redis is unreachable the revocation applies to this worker right away and is
+    written once Redis is back, see ``replay_revocations``.
     """
     try:
-        jti = get_redix_prefix_jwt_token() + token_jti
-        RedisModel().set_logout_key(token_jti=jti, token_name=token_name)
+        with metrics.timer("redis", "revoke_token"):
+            RedisModel().set_logout_key(
+                token_jti=token_jti, token_name=token_name, expires=expires
+            )
+            revocation_cache.publish(token_jti, expires)
     except NoResultFound:
         raise Exception("Could not find the token {}".format(token_jti))
+    except redis.RedisError as e:
+        app.logger.warning(f"revocation of {token_jti} queued: {str(e)}")
+        revocation_cache.add(token_jti, expires)
+        _defer([("token", token_jti, expires)])
+
+
+def revoke_tokens(tokens):
+    """Revokes many tokens at once
+
+    ``tokens`` are ``(jti, exp)`` pairs, written to Redis and broadcast to the other workers
+    in one round trip each.
+    """
+    tokens = list(tokens)
+    try:
+        with metrics.timer("redis", "revoke_tokens"):
+            RedisModel().revoke_many(tokens)
+            revocation_cache.publish_many(tokens)
+    except redis.RedisError as e:
+        app.logger.warning(f"revocation of {len(tokens)} tokens queued: {str(e)}")
+        for jti, expires in tokens:
+            revocation_cache.add(jti, expires)
+        _defer([("token", jti, expires) for jti, expires in tokens])
+
+
+def revoke_all_tokens(user_id):
+    """Revokes every token issued to the user so far, on every device
+
+    Only the user's watermark is written, so this costs a single Redis write no matter how
+    many tokens are outstanding. The ``iat`` claim has a one second resolution, so the
+    watermark is a whole second as well: tokens issued during the second of the call stay
+    valid, which lets the user log in again right after changing their password.
+    """
+    revoked_before = int(time.time())
+    try:
+        with metrics.timer("redis", "revoke_all_tokens"):
+            RedisModel().set_revoked_before(user_id=user_id, revoked_before=revoked_before)
+            revocation_cache.publish_revoked_before(user_id, revoked_before)
+    except redis.RedisError as e:
+        app.logger.warning(f"revocation of the tokens of user {user_id} queued: {str(e)}")
+        revocation_cache.set_revoked_before(user_id, revoked_before)
+        _defer([("user", user_id, revoked_before)])
+
+
+def replay_revocations():
+    """Write the revocations queued while Redis was unreachable
+
+    Called on the revocation checks: while the circuit breaker is open this fails at
+    once without a network call, and the queue is kept for the next attempt.
+    """
+    with _pending_lock:
+        pending = _pending[:]
+        del _pending[:]
+    if not pending:
+        return
+
+    now = time.time()
+    tokens = [
+        (jti, expires)
+        for kind, jti, expires in pending
+        if kind == "token" and expires > now
+    ]
+    watermarks = [
+        (user_id, revoked_before)
+        for kind, user_id, revoked_before in pending
+        if kind == "user"
+    ]
+    try:
+        if tokens:
+            RedisModel().revoke_many(tokens)
+            revocation_cache.publish_many(tokens)
+        for user_id, revoked_before in watermarks:
+            RedisModel().set_revoked_before(user_id=user_id, revoked_before=revoked_before)
+            revocation_cache.publish_revoked_before(user_id, revoked_before)
+    except redis.RedisError:
+        # writes are idempotent, the whole queue is replayed on the next attempt
+        _defer(pending, front=True)
+        return
+    app.logger.info(f"replayed {len(pending)} revocations queued while Redis was unreachable")
+
+
+def _defer(revocations, front=False):
+    with _pending_lock:
+        if front:
+            _pending[:0] = revocations
+        else:
+            _pending.extend(revocations)
@@ -0,0 +1,243 @@
+import base64
+import glob
+import hashlib
+import json
+import os
+
+import click
+import jwt as pyjwt
+from flask import current_app
+from flask.cli import with_appcontext
+
+from common.response import etagged
+from extension import jwt
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+except ImportError:  # only needed by the asymmetric algorithms
+    default_backend = serialization = ec = rsa = None
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "RS384", "RS512", "ES256", "ES384", "ES512")
+# ES algorithm: (curve class name, JWK curve name, curve name of cryptography)
+CURVES = {
+    "ES256": ("SECP256R1", "P-256", "secp256r1"),
+    "ES384": ("SECP384R1", "P-384", "secp384r1"),
+    "ES512": ("SECP521R1", "P-521", "secp521r1"),
+}
+
+
+def require_cryptography(algorithm):
+    if rsa is None:
+        raise RuntimeError(f"{algorithm} needs the cryptography package")
+
+
+def _b64(number, length=None):
+    data = number.to_bytes(length or (number.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def to_jwk(kid, algorithm, public_key):
+    """The public JWK of ``public_key``, as served in the JWKS document
+
+    ``alg`` follows the type of the key: ``algorithm`` when it matches, so a key retired
+    by a switch from RS256 to ES256 is still published as an RSA key.
+    """
+    numbers = public_key.public_numbers()
+    if isinstance(public_key, rsa.RSAPublicKey):
+        alg = algorithm if algorithm.startswith("RS") else "RS256"
+        jwk = {"kid": kid, "alg": alg, "use": "sig"}
+        jwk.update(kty="RSA", n=_b64(numbers.n), e=_b64(numbers.e))
+    else:
+        alg, crv = next(
+            (alg, crv)
+            for alg, (_, crv, name) in CURVES.items()
+            if name == public_key.curve.name
+        )
+        size = (public_key.curve.key_size + 7) // 8
+        jwk = {"kid": kid, "alg": alg, "use": "sig"}
+        jwk.update(kty="EC", crv=crv, x=_b64(numbers.x, size), y=_b64(numbers.y, size))
+    return jwk
+
+
+def fits(algorithm, private_key):
+    """Whether ``private_key`` can sign ``algorithm``"""
+    if algorithm in CURVES:
+        return (
+            isinstance(private_key, ec.EllipticCurvePrivateKey)
+            and private_key.curve.name == CURVES[algorithm][2]
+        )
+    return isinstance(private_key, rsa.RSAPrivateKey)
+
+
+class KeyRing(object):
+    """Keys signing and verifying the JWTs, parsed once when the app starts.
+
+    With an asymmetric ``JWT_ALGORITHM`` (RS256, ES256, ...) the keys are the PEM files
+    of ``JWT_KEYS_DIR``, the file name being the key id: ``<kid>.pem`` holds a private
+    key, ``<kid>.pub.pem`` the public key of a retired one, kept to verify the tokens it
+    signed until they expire. Tokens are signed by ``JWT_ACTIVE_KID``, which may only be
+    left unset with a single private key, and carry its id in their ``kid`` header, so
+    rotating means adding a key, publishing it, then switching ``JWT_ACTIVE_KID``.
+
+    The public keys are served as a JWKS document at ``JWKS_URL`` so other services can
+    verify the tokens themselves. With HS256, the default, ``JWT_SECRET_KEY`` is used
+    as before and the document is empty.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.active_kid = None
+        self.signing_keys = {}
+        self.verification_keys = {}
+        self.document = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("JWT_ALGORITHM", "HS256")
+        app.config.setdefault("JWT_KEYS_DIR", None)
+        app.config.setdefault("JWT_ACTIVE_KID", None)
+        app.config.setdefault("JWKS_URL", "/.well-known/jwks.json")
+        app.config.setdefault("JWKS_CACHE_MAX_AGE", 300)
+        self.app = app
+        app.extensions["jwt_keys"] = self
+        app.add_url_rule(app.config["JWKS_URL"], "jwks", self.jwks)
+        app.cli.add_command(generate_jwt_key_command)
+        if self.asymmetric:
+            self.load()
+
+    @property
+    def asymmetric(self):
+        return self.app.config["JWT_ALGORITHM"] in ASYMMETRIC_ALGORITHMS
+
+    def load(self):
+        """(Re)read the keys of ``JWT_KEYS_DIR`` and rebuild the JWKS document"""
+        require_cryptography(self.app.config["JWT_ALGORITHM"])
+        keys_dir = self.app.config["JWT_KEYS_DIR"]
+        if not keys_dir:
+            raise RuntimeError(
+                f"JWT_KEYS_DIR is required with {self.app.config['JWT_ALGORITHM']}"
+            )
+
+        signing_keys = {}
+        verification_keys = {}
+        for path in sorted(glob.glob(os.path.join(keys_dir, "*.pem"))):
+            name = os.path.basename(path)
+            with open(path, "rb") as f:
+                data = f.read()
+            if name.endswith(".pub.pem"):
+                kid = name[: -len(".pub.pem")]
+                public_key = serialization.load_pem_public_key(data, default_backend())
+            else:
+                kid = name[: -len(".pem")]
+                private_key = serialization.load_pem_private_key(
+                    data, password=None, backend=default_backend()
+                )
+                signing_keys[kid] = private_key
+                public_key = private_key.public_key()
+            verification_keys[kid] = public_key
+
+        active_kid = self.app.config["JWT_ACTIVE_KID"]
+        if active_kid is None:
+            # a key just added must not sign before it is published, name the active one
+            if len(signing_keys) > 1:
+                raise RuntimeError(
+                    f"JWT_ACTIVE_KID is required with several private keys in {keys_dir}"
+                )
+            active_kid = next(iter(signing_keys), None)
+        if active_kid not in signing_keys:
+            raise RuntimeError(f"no private key {active_kid!r} in {keys_dir}")
+
+        algorithm = self.app.config["JWT_ALGORITHM"]
+        if not fits(algorithm, signing_keys[active_kid]):
+            raise RuntimeError(f"private key {active_kid!r} can not sign {algorithm}")
+        body = json.dumps(
+            {
+                "keys": [
+                    to_jwk(kid, algorithm, key) for kid, key in verification_keys.items()
+                ]
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        self.signing_keys = signing_keys
+        self.verification_keys = verification_keys
+        self.active_kid = active_kid
+        self.document = {"body": body, "etag": hashlib.sha256(body).hexdigest()}
+
+    def signing_key(self):
+        if not self.asymmetric:
+            return self.app.config["JWT_SECRET_KEY"]
+        return self.signing_keys[self.active_kid]
+
+    def verification_key(self, kid):
+        if not self.asymmetric:
+            return self.app.config["JWT_SECRET_KEY"]
+        key = self.verification_keys.get(kid or self.active_kid)
+        if key is None:
+            raise pyjwt.InvalidTokenError(f"unknown key id {kid}")
+        return key
+
+    def headers(self):
+        return {"kid": self.active_kid} if self.asymmetric else {}
+
+    def jwks(self):
+        document = self.document or {"body": b'{"keys":[]}', "etag": "empty"}
+        cache_control = "public, max-age={0}".format(current_app.config["JWKS_CACHE_MAX_AGE"])
+        return etagged(
+            document["etag"], document["body"], headers={"Cache-Control": cache_control}
+        )
+
+
+key_ring = KeyRing()
+
+
+@jwt.encode_key_loader
+def encode_key(identity):
+    return key_ring.signing_key()
+
+
+@jwt.decode_key_loader
+def decode_key(claims, headers):
+    return key_ring.verification_key(headers.get("kid"))
+
+
+@jwt.additional_headers_loader
+def key_id_header(identity):
+    return key_ring.headers()
+
+
+@click.command("generate-jwt-key")
+@click.argument("kid")
+@click.option("--algorithm", default=None, help="defaults to JWT_ALGORITHM")
+@with_appcontext
+def generate_jwt_key_command(kid, algorithm):
+    """Write a new private key <kid>.pem to JWT_KEYS_DIR"""
+    algorithm = algorithm or current_app.config["JWT_ALGORITHM"]
+    if algorithm in ASYMMETRIC_ALGORITHMS and rsa is None:
+        raise click.UsageError(f"{algorithm} needs the cryptography package")
+    if algorithm in CURVES:
+        curve = getattr(ec, CURVES[algorithm][0])()
+        private_key = ec.generate_private_key(curve, default_backend())
+    elif algorithm.startswith("RS"):
+        private_key = rsa.generate_private_key(65537, 2048, default_backend())
+    else:
+        raise click.BadParameter(f"{algorithm} has no key pair", param_hint="--algorithm")
+
+    keys_dir = current_app.config["JWT_KEYS_DIR"]
+    if not keys_dir:
+        raise click.UsageError("set JWT_KEYS_DIR first")
+    os.makedirs(keys_dir, exist_ok=True)
+    path = os.path.join(keys_dir, f"{kid}.pem")
+    with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as f:
+        f.write(
+            private_key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        )
+    click.echo(f"wrote {path}, restart the workers to load it")
@@ -5,20 +5,41 @@ from flask import request, jsonify, Blueprint, current_app as app
 from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
+    decode_token,
     jwt_required,
     jwt_refresh_token_required,
     get_jwt_identity,
     get_raw_jwt,
 )
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, InvalidTokenError
+from marshmallow import ValidationError
 from sqlalchemy.exc import SQLAlchemyError
 
-from auth.helpers import add_token_to_database, revoke_token, is_token_revoked
+from auth.audit import audit_log
+from auth.helpers import (
+    add_token_to_database,
+    are_tokens_revoked,
+    revoke_token,
+    revoke_all_tokens,
+    is_token_revoked,
+)
 from common.response import Response
-from extension import db, pwd_context, apispec, jwt
+from extension import db, hasher, apispec, identity_cache, jwt, limiter
 from models.user import User
-from schema.user import UserSchema
+from schema.auth import (
+    ChangePasswordSchema,
+    IntrospectSchema,
+    LoginSchema,
+    ResetPasswordSchema,
+    change_password_schema,
+    introspect_schema,
+    login_schema,
+    reset_password_schema,
+)
 
 blueprint = Blueprint("auth", __name__, url_prefix="/auth")
+blueprint.before_request(limiter.check)
 
 
 @blueprint.route("/login", methods=["POST"])
@@ -33,16 +54,7 @@ def login():
         content:
           application/json:
             schema:
-              type: object
-              properties:
-                username:
-                  type: string
-                  example: admin
-                  required: true
-                password:
-                  type: string
-                  example: admin
-                  required: true
+              $ref: '#/components/schemas/LoginSchema'
       responses:
         200:
           content:
@@ -67,18 +79,17 @@ def login():
             HTTPStatus.BAD_REQUEST,
         )
 
-    username = request.json.get("username", None)
-    password = request.json.get("password", None)
-    if not username or not password:
-        response_body = {"message": "Missing username or password"}
-        return (
-            Response(400).wrap(response_body=response_body),
-            HTTPStatus.BAD_REQUEST,
-        )
+    data = login_schema.load(request.json)
+    username = data["username"]
+    password = data["password"]
 
     try:
-        user = User.query.filter_by(username=username).first()
+        with db.read_replica():
+            user = User.query.filter_by(username=username).first()
         if user is None:
+            audit_log.record(
+                "login", success=False, username=username, detail="user not found"
+            )
             response_body = {"message": "User not found"}
             return (
                 Response(401).wrap(response_body=response_body),
@@ -94,13 +105,31 @@ def login():
             HTTPStatus.INTERNAL_SERVER_ERROR,
         )
 
-    if user is None or not pwd_context.verify(password, user.password):
+    valid, new_hash = hasher.verify_and_update(password, user.password)
+    if not valid:
+        audit_log.record(
+            "login",
+            success=False,
+            user_id=user.id,
+            username=username,
+            detail="invalid password",
+        )
         response_body = {"message": "Unauthorized"}
         return (
             Response(401).wrap(response_body=response_body),
             HTTPStatus.UNAUTHORIZED,
         )
 
+    if new_hash is not None:
+        # the stored hash uses outdated settings, replace it while we know the password
+        try:
+            user.password = new_hash
+            db.session.commit()
+        except SQLAlchemyError as e:
+            app.logger.error(f"could not upgrade password hash {str(e)}")
+            db.session.rollback()
+
+    audit_log.record("login", user_id=user.id, username=username)
     ret = create_response_body(user)
     response_body = {"data": ret}
     return Response(200).wrap(response_body=response_body), HTTPStatus.OK
@@ -167,6 +196,9 @@ def refresh():
     """
     current_user = get_jwt_identity()
     access_token = create_access_token(identity=current_user)
+    audit_log.record(
+        "refresh", user_id=current_user["id"], username=current_user["username"]
+    )
     ret = {"access_token": access_token}
     add_token_to_database(access_token, app.config["JWT_IDENTITY_CLAIM"])
     return Response(200).wrap(response_body=ret), HTTPStatus.OK
@@ -196,9 +228,9 @@ def revoke_access_token():
         401:
           description: unauthorized
     """
-    jti = get_raw_jwt()["jti"]
-    user_identity = get_jwt_identity()
-    revoke_token(jti, "access")
+    raw_jwt = get_raw_jwt()
+    revoke_token(raw_jwt["jti"], "access", expires=raw_jwt["exp"])
+    audit_log.record("revoke", user_id=get_jwt_identity()["id"], detail="access")
     return (
         Response(200).wrap(response_body={"message": "token revoked"}),
         HTTPStatus.OK,
@@ -229,40 +261,125 @@ def revoke_refresh_token():
         401:
           description: unauthorized
     """
-    jti = get_raw_jwt()["jti"]
-    user_identity = get_jwt_identity()
-    revoke_token(jti, "refresh")
+    raw_jwt = get_raw_jwt()
+    revoke_token(raw_jwt["jti"], "refresh", expires=raw_jwt["exp"])
+    audit_log.record("revoke", user_id=get_jwt_identity()["id"], detail="refresh")
     return (
         Response(200).wrap(response_body={"message": "token revoked"}),
         HTTPStatus.OK,
     )
 
 
-def validation_data_check(mandatory_fields, req_data):
-    for key in req_data:
-        if key not in mandatory_fields:
-            raise ValueError(f"{key} can not be present")
-    field_missing = list(set(mandatory_fields) - set(list(req_data.keys())))
-    if len(field_missing) != 0:
-        raise ValueError(f"mandatory fields are missing {field_missing}")
+@blueprint.route("/revoke_all", methods=["DELETE"])
+@jwt_required
+def revoke_all():
+    """Revoke every access and refresh token of the current user, used to logout everywhere
 
+    ---
+    delete:
+      tags:
+        - auth
+      responses:
+        200:
+          content:
+            application/json:
+              schema:
+                type: object
+                properties:
+                  message:
+                    type: string
+                    example: all tokens revoked
+        400:
+          description: bad request
+        401:
+          description: unauthorized
+    """
+    revoke_all_tokens(get_jwt_identity()["id"])
+    audit_log.record("revoke", user_id=get_jwt_identity()["id"], detail="all")
+    return (
+        Response(200).wrap(response_body={"message": "all tokens revoked"}),
+        HTTPStatus.OK,
+    )
 
-def check_new_password_confirm_password(new_password, confirm_password):
-    if len(new_password) != len(confirm_password):
-        raise ValueError("password does not match")
-    if new_password != confirm_password:
-        raise ValueError("password does not match")
-    if new_password.__eq__(confirm_password) is not True:
-        raise ValueError("password does not match")
 
+@blueprint.route("/introspect", methods=["POST"])
+@jwt_required
+def introspect():
+    """Check many tokens at once, e.g. for a gateway
 
-def fetch_change_pass_req_body(req_data):
-    return (
-        req_data["user_id"],
-        req_data["current_password"],
-        req_data["new_password"],
-        req_data["confirm_password"],
-    )
+    ---
+    post:
+      tags:
+        - auth
+      requestBody:
+        content:
+          application/json:
+            schema:
+              $ref: '#/components/schemas/IntrospectSchema'
+      responses:
+        200:
+          content:
+            application/json:
+              schema:
+                type: object
+                properties:
+                  results:
+                    type: array
+                    description: one result per token, in the order of the request
+                    items:
+                      type: object
+                      properties:
+                        active:
+                          type: boolean
+                        reason:
+                          type: string
+                          enum: [expired, invalid, revoked, inactive_user]
+                        claims:
+                          type: object
+                        user:
+                          type: object
+        400:
+          description: bad request
+        401:
+          description: unauthorized
+    """
+    if not request.is_json:
+        response_body = {"message": "Missing JSON in request"}
+        return Response(400).wrap(response_body), HTTPStatus.BAD_REQUEST
+    tokens = introspect_schema.load(request.json)["tokens"]
+
+    results = [None] * len(tokens)
+    decoded = {}
+    for index, token in enumerate(tokens):
+        try:
+            decoded[index] = decode_token(token)
+        except ExpiredSignatureError:
+            results[index] = {"active": False, "reason": "expired"}
+        except (InvalidTokenError, JWTExtendedException):
+            results[index] = {"active": False, "reason": "invalid"}
+
+    # one Redis round trip and one query whatever the number of tokens
+    identity_claim = app.config["JWT_IDENTITY_CLAIM"]
+    revoked = are_tokens_revoked(list(decoded.values())) if decoded else []
+    user_ids = {claims[identity_claim]["id"] for claims in decoded.values()}
+    users = {}
+    if user_ids:
+        with db.read_replica():
+            users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+
+    for (index, claims), is_revoked in zip(decoded.items(), revoked):
+        user = users.get(claims[identity_claim]["id"])
+        if is_revoked:
+            results[index] = {"active": False, "reason": "revoked"}
+        elif user is None or not user.active:
+            results[index] = {"active": False, "reason": "inactive_user"}
+        else:
+            results[index] = {
+                "active": True,
+                "claims": claims,
+                "user": {"id": user.id, "username": user.username},
+            }
+    return Response(200).wrap({"results": results}), HTTPStatus.OK
 
 
 def validation_authority(current_user):
@@ -283,20 +400,7 @@ def change_password():
         content:
           application/json:
             schema:
-              type: object
-              properties:
-                user_id:
-                  type: integer
-                  required: true
-                current_password:
-                  type: string
-                  required: true
-                new_password:
-                  type: string
-                  required: true
-                confirm_password:
-                  type: string
-                  required: true
+              $ref: '#/components/schemas/ChangePasswordSchema'
       responses:
         200:
           content:
@@ -322,39 +426,29 @@ def change_password():
         response_body = {"message": "Missing JSON in request"}
         return Response(400).wrap(response_body), HTTPStatus.BAD_REQUEST
 
-    _mandatory_fields = [
-        "user_id",
-        "current_password",
-        "new_password",
-        "confirm_password",
-    ]
-    req_data = request.json
+    data = change_password_schema.load(request.json)
+    user_id = data["user_id"]
     try:
-        validation_data_check(_mandatory_fields, req_data)
-        user_id, current_password, new_password, confirm_password = fetch_change_pass_req_body(
-            req_data=request.json
-        )
 
         user = User.query.filter_by(id=user_id).first()
-        app.logger.info(
-            f"password mismatch {pwd_context.verify(current_password, user.password)}"
-        )
-        if user is None or not pwd_context.verify(
-            current_password, user.password
-        ):
+        if user is None or not hasher.verify(data["current_password"], user.password):
+            audit_log.record(
+                "change_password",
+                success=False,
+                user_id=user_id,
+                detail="invalid current password",
+            )
             response_body = {"message": "unauthorized"}
             return Response(401).wrap(response_body), HTTPStatus.UNAUTHORIZED
 
-        check_new_password_confirm_password(new_password, confirm_password)
         app.logger.info(get_jwt_identity())
-        update_data = {
-            "password": pwd_context.hash(new_password)
-            # "updated_by": get_jwt_identity().get("username"),
-            # "updated_on": datetime.datetime.now().isoformat(),
-        }
-        obj = UserSchema().load(update_data, instance=user, partial=True)
-        db.session.add(obj)
+        user.password = hasher.hash(data["new_password"])
+        # user.updated_by = get_jwt_identity().get("username")
+        # user.updated_on = datetime.datetime.now().isoformat()
         db.session.commit()
+        revoke_all_tokens(user.id)
+        identity_cache.invalidate(user.id)
+        audit_log.record("change_password", user_id=user.id, username=user.username)
         response_body = {"message": "password changed successfully"}
         return Response(200).wrap(response_body), HTTPStatus.OK
 
@@ -384,14 +478,7 @@ def reset_password():
         content:
           application/json:
             schema:
-              type: object
-              properties:
-                username:
-                  type: string
-                  required: true
-                password:
-                  type: string
-                  required: true
+              $ref: '#/components/schemas/ResetPasswordSchema'
       responses:
         200:
           content:
@@ -419,11 +506,9 @@ def reset_password():
         )
         # return jsonify({"msg": "Missing JSON in request"}), HTTPStatus.BAD_REQUEST
 
-    _mandatory_fields = ["username", "password"]
-    req_data = request.json
+    req_data = reset_password_schema.load(request.json)
 
     try:
-        validation_data_check(_mandatory_fields, req_data)
         authorized_user = validation_authority(
             get_jwt_identity().get("username")
         )
@@ -441,17 +526,27 @@ def reset_password():
                     HTTPStatus.UNAUTHORIZED,
                 )
 
-            update_data = {
-                "password": pwd_context.hash(password),
-                # "updated_by": current_user,
-                # "updated_on": current_time,
-            }
-            obj = UserSchema().load(update_data, instance=user, partial=True)
-            db.session.add(obj)
+            user.password = hasher.hash(password)
+            # user.updated_by = current_user
+            # user.updated_on = current_time
             db.session.commit()
+            revoke_all_tokens(user.id)
+            identity_cache.invalidate(user.id)
+            audit_log.record(
+                "reset_password",
+                user_id=user.id,
+                username=user.username,
+                detail=f"by {get_jwt_identity()['id']}",
+            )
             response_body = {"message": "password reset successfully"}
             return Response(200).wrap(response_body), HTTPStatus.OK
         elif authorized_user == "unauthorized":
+            audit_log.record(
+                "reset_password",
+                success=False,
+                user_id=get_jwt_identity()["id"],
+                detail="not authorized",
+            )
             response_body = {"message": "unauthorized"}
             return (
                 Response(401).wrap(response_body=response_body),
@@ -478,7 +573,16 @@ def reset_password():
 
 @jwt.user_loader_callback_loader
 def user_loader_callback(identity):
-    return User.query.get(identity["id"])
+    user = identity_cache.get(identity["id"])
+    if user is None or not user.active:
+        return None
+    return user
+
+
+@identity_cache.loader
+def load_identity(user_id):
+    with db.read_replica():
+        return User.query.get(user_id)
 
 
 @jwt.token_in_blacklist_loader
@@ -486,11 +590,24 @@ def check_if_token_revoked(decoded_token):
     return is_token_revoked(decoded_token)
 
 
-@blueprint.before_app_first_request
-def register_views():
-    apispec.spec.path(view=login, app=app)
-    apispec.spec.path(view=refresh, app=app)
-    apispec.spec.path(view=revoke_access_token, app=app)
-    apispec.spec.path(view=revoke_refresh_token, app=app)
-    apispec.spec.path(view=change_password, app=app)
-    apispec.spec.path(view=reset_password, app=app)
+@blueprint.errorhandler(ValidationError)
+def handle_validation_error(e):
+    """Invalid request bodies get the usual envelope, errors listed by field"""
+    response_body = {"message": "invalid request body", "errors": e.messages}
+    return Response(400).wrap(response_body=response_body), HTTPStatus.BAD_REQUEST
+
+
+@blueprint.record_once
+def register_views(state):
+    apispec.spec.components.schema("LoginSchema", schema=LoginSchema)
+    apispec.spec.components.schema("ChangePasswordSchema", schema=ChangePasswordSchema)
+    apispec.spec.components.schema("ResetPasswordSchema", schema=ResetPasswordSchema)
+    apispec.spec.components.schema("IntrospectSchema", schema=IntrospectSchema)
+    apispec.register_view(login, app=state.app)
+    apispec.register_view(refresh, app=state.app)
+    apispec.register_view(revoke_access_token, app=state.app)
+    apispec.register_view(revoke_refresh_token, app=state.app)
+    apispec.register_view(revoke_all, app=state.app)
+    apispec.register_view(change_password, app=state.app)
+    apispec.register_view(reset_password, app=state.app)
+    apispec.register_view(introspect, app=state.app)
@@ -0,0 +1,203 @@
+"""Load test the auth flow: login, authenticated call, refresh and revoke
+
+Boots the app on a temporary SQLite database and an in-process fakeredis server, seeds
+the users, then runs the flow from concurrent threads through the test client:
+
+    python -m benchmarks.auth_flow --users 100 --concurrency 8 --flows 50 --json auth.json
+
+Every request goes through the whole app (JWT callbacks, revocation and identity caches,
+password hashing) but not through a network stack. Needs ``fakeredis``.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import fakeredis
+from flask_jwt_extended import current_user, jwt_required
+
+from models.redis_models.redis_model import InstrumentedConnectionPool, set_redis_pool
+
+ENDPOINTS = ("login", "authenticated", "refresh", "revoke_access", "revoke_refresh")
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def percentile(ordered, ratio):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(ratio * len(ordered)))]
+
+
+def build_app(database_uri, pbkdf2_rounds):
+    from app import create_app
+
+    set_redis_pool(
+        InstrumentedConnectionPool(
+            connection_class=fakeredis.FakeConnection,
+            server=fakeredis.FakeServer(),
+            decode_responses=True,
+        )
+    )
+    os.environ["DATABASE_URI"] = database_uri
+    if pbkdf2_rounds:
+        os.environ["PBKDF2_ROUNDS"] = str(pbkdf2_rounds)
+    app = create_app("development")
+    # the flow logs in the same users again and again, the limits would answer 429
+    app.config["RATELIMIT_ENABLED"] = False
+    app.logger.disabled = True
+
+    @app.route("/bench/me")
+    @jwt_required
+    def me():
+        return {"id": current_user.id}
+
+    return app
+
+
+def seed(app, users):
+    from extension import db
+    from models.user import User
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(
+            User(username=f"user{i}", email=f"user{i}@example.com", password=f"password{i}")
+            for i in range(users)
+        )
+        db.session.commit()
+
+
+def run_flows(app, user_ids, flows, timings, errors):
+    client = app.test_client()
+
+    def call(name, method, url, **kwargs):
+        started = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        timings[name].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors[name] += 1
+            return None
+        return response.get_json()
+
+    for flow in range(flows):
+        i = user_ids[flow % len(user_ids)]
+        body = call(
+            "login",
+            "POST",
+            "/auth/login",
+            json={"username": f"user{i}", "password": f"password{i}"},
+        )
+        if body is None:
+            continue
+        tokens = body["success"]["data"]
+        access = {"Authorization": f"Bearer {tokens['access_token']}"}
+        refresh = {"Authorization": f"Bearer {tokens['refresh_token']}"}
+        call("authenticated", "GET", "/bench/me", headers=access)
+        body = call("refresh", "POST", "/auth/refresh", headers=refresh)
+        if body is not None:
+            access = {"Authorization": f"Bearer {body['success']['access_token']}"}
+        call("revoke_access", "DELETE", "/auth/revoke_access", headers=access)
+        call("revoke_refresh", "DELETE", "/auth/revoke_refresh", headers=refresh)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--flows", type=int, default=50, help="flows run by each thread")
+    parser.add_argument(
+        "--pbkdf2-rounds", type=int, help="rounds of the seeded hashes, config default if unset"
+    )
+    parser.add_argument("--json", dest="json_path", help="also write the results here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = build_app(f"sqlite:///{directory}/auth_flow.db", args.pbkdf2_rounds)
+        seed(app, args.users)
+
+        timings = defaultdict(list)
+        errors = defaultdict(int)
+        threads = [
+            threading.Thread(
+                target=run_flows,
+                args=(
+                    app,
+                    list(range(t, args.users, args.concurrency)) or [t % args.users],
+                    args.flows,
+                    timings,
+                    errors,
+                ),
+            )
+            for t in range(args.concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+    results = {}
+    print(f"{args.concurrency} threads, {args.flows} flows each, {wall:.2f}s")
+    print(f"{'endpoint':<16}{'requests':>10}{'errors':>8}{'req/s':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name in ENDPOINTS:
+        ordered = sorted(timings[name])
+        results[name] = {
+            "requests": len(ordered),
+            "errors": errors[name],
+            "throughput": len(ordered) / wall,
+            "p50": percentile(ordered, 0.50),
+            "p95": percentile(ordered, 0.95),
+            "p99": percentile(ordered, 0.99),
+        }
+        if ordered:
+            print(
+                f"{name:<16}{len(ordered):>10}{errors[name]:>8}{len(ordered) / wall:>10.1f}"
+                + "".join(
+                    f"{results[name][p] * 1000:>10.2f}" for p in ("p50", "p95", "p99")
+                )
+            )
+
+    if args.json_path:
+        commit, dirty = git_commit()
+        with open(args.json_path, "w") as f:
+            json.dump(
+                {
+                    "commit": commit,
+                    "dirty": dirty,
+                    "python": platform.python_version(),
+                    "parameters": vars(args),
+                    "wall_seconds": wall,
+                    "flows_per_second": args.concurrency * args.flows / wall,
+                    "endpoints": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Measure the cold start of a worker: imports and ``create_app``
+
+Runs ``python -X importtime`` in a fresh interpreter and summarizes where the time goes:
+
+    python -m benchmarks.import_time --config testing --top 15 --json import_time.json
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+BOOT = (
+    "import time; started = time.perf_counter(); "
+    "from app import create_app; create_app({config!r}); "
+    "print(time.perf_counter() - started)"
+)
+
+
+def parse_importtime(stderr):
+    """Return ``(module, self_us, cumulative_us)`` for each line of ``-X importtime``"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default="testing")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", dest="json_path", help="also write the results here")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", BOOT.format(config=args.config)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall = time.perf_counter() - started
+    boot = float(result.stdout.strip().splitlines()[-1])
+    modules = parse_importtime(result.stderr)
+    imports_us = sum(self_us for _, self_us, _ in modules)
+
+    # top level packages only, their cumulative time includes what they pull in
+    packages = {}
+    for name, _, cumulative_us in modules:
+        if "." not in name:
+            packages[name] = packages.get(name, 0) + cumulative_us
+    top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[: args.top]
+
+    print(f"interpreter + boot: {wall * 1000:8.1f}ms")
+    print(f"create_app + imports: {boot * 1000:6.1f}ms")
+    print(f"imports (sum of self): {imports_us / 1000:5.1f}ms over {len(modules)} modules")
+    for name, cumulative_us in top:
+        print(f"  {name:<32}{cumulative_us / 1000:8.1f}ms")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(
+                {
+                    "wall_seconds": wall,
+                    "boot_seconds": boot,
+                    "imports_seconds": imports_us / 1e6,
+                    "modules": len(modules),
+                    "top_packages": [
+                        {"name": name, "cumulative_seconds": cumulative_us / 1e6}
+                        for name, cumulative_us in top
+                    ],
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compare the cost of signing and verifying tokens across JWT algorithms
+
+``pem`` hands PyJWT the serialized keys, parsed again on every call; ``parsed`` hands it
+the key objects loaded once, as ``auth.keys.KeyRing`` does:
+
+    python -m benchmarks.jwt_algorithms --iterations 2000
+
+EdDSA is not listed: PyJWT 1.7, pinned by Flask-JWT-Extended 3, does not support it.
+"""
+import argparse
+import time
+
+import jwt
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+CLAIMS = {
+    "iat": 1600000000,
+    "nbf": 1600000000,
+    "jti": "0b8e1a4c-6f3e-4a1f-9a53-2f1e6c7d8e9f",
+    "exp": 4100000000,
+    "identity": {"id": 42, "username": "admin"},
+    "fresh": False,
+    "type": "access",
+}
+
+
+def key_pairs():
+    """``(algorithm, private key, public key)`` as objects, HS256 uses a shared secret"""
+    yield "HS256", "secret" * 8, "secret" * 8
+    rsa_key = rsa.generate_private_key(65537, 2048, default_backend())
+    yield "RS256", rsa_key, rsa_key.public_key()
+    ec_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+    yield "ES256", ec_key, ec_key.public_key()
+
+
+def to_pem(key):
+    if isinstance(key, str):
+        return key
+    if hasattr(key, "private_bytes"):
+        return key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    return key.public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+
+def measure(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'algorithm':<10}{'keys':<8}{'sign us':>10}{'verify us':>11}{'token bytes':>13}")
+    for algorithm, private_key, public_key in key_pairs():
+        for name, signing, verifying in (
+            ("pem", to_pem(private_key), to_pem(public_key)),
+            ("parsed", private_key, public_key),
+        ):
+            token = jwt.encode(CLAIMS, signing, algorithm=algorithm)
+            sign = measure(
+                lambda: jwt.encode(CLAIMS, signing, algorithm=algorithm), args.iterations
+            )
+            verify = measure(
+                lambda: jwt.decode(token, verifying, algorithms=[algorithm]),
+                args.iterations,
+            )
+            print(
+                f"{algorithm:<10}{name:<8}{sign * 1e6:>10.1f}{verify * 1e6:>11.1f}"
+                f"{len(token):>13}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Compare the cost of building an enveloped JSON response
+
+``legacy`` is the previous implementation, a dict carrying an ``HTTPStatus`` handed to
+``jsonify``; ``envelope`` is ``common.response.Response.wrap``:
+
+    python -m benchmarks.response_envelope --iterations 50000
+"""
+import argparse
+import time
+import tracemalloc
+from http import HTTPStatus
+
+from flask import Flask, jsonify
+
+from common.response import Response, orjson
+
+BODY = {
+    "data": {
+        "access_token": "a" * 300,
+        "refresh_token": "r" * 300,
+        "user_id": 42,
+    }
+}
+
+
+def legacy(status, response_body):
+    status = HTTPStatus(status)
+    envelope = {
+        "status": status.phrase,
+        "code": status,
+        "success": response_body if status.value < 400 else None,
+        "error": None if status.value < 400 else response_body,
+    }
+    return jsonify(envelope)
+
+
+def envelope(status, response_body):
+    return Response(status).wrap(response_body)
+
+
+def measure(build, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        build(200, BODY)
+    elapsed = time.perf_counter() - started
+
+    # peak of memory held while building one response, above what was held before
+    tracemalloc.start()
+    peaks = 0
+    for _ in range(1000):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        build(200, BODY)
+        peaks += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return elapsed / iterations, peaks / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    # the production setting, pretty printing would only slow the legacy path further
+    app.config["JSONIFY_PRETTYPRINT_REGULAR"] = False
+
+    print(f"json backend: {'orjson' if orjson is not None else 'stdlib'}")
+    print(f"{'builder':<10}{'us/response':>14}{'peak bytes/response':>22}")
+    with app.test_request_context():
+        results = {}
+        for name, build in (("legacy", legacy), ("envelope", envelope)):
+            per_call, peak = measure(build, args.iterations)
+            results[name] = per_call
+            print(f"{name:<10}{per_call * 1e6:>14.2f}{peak:>22.0f}")
+    print(f"speedup: {results['legacy'] / results['envelope']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
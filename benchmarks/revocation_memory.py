@@ -0,0 +1,61 @@
+"""Compare the Redis memory used by the revocation storage layouts
+
+Needs a real Redis server, the given database is flushed before each run:
+
+    python -m benchmarks.revocation_memory --tokens 100000 --db 15
+"""
+import argparse
+import time
+import uuid
+
+from flask import Flask
+
+from config import Config
+from models.redis_models.redis_model import RedisModel, connect_with_redis
+
+
+def used_memory(client):
+    return client.info("memory")["used_memory"]
+
+
+def measure(app, storage, tokens, batch):
+    app.config["REDIS_REVOCATION_STORAGE"] = storage
+    client = connect_with_redis()
+    client.flushdb()
+    before = used_memory(client)
+    for start in range(0, len(tokens), batch):
+        RedisModel().revoke_many(tokens[start:start + batch])
+    return used_memory(client) - before, client.dbsize()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=100000)
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument(
+        "--lifetime", type=int, default=900, help="token lifetime in seconds"
+    )
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config["REDIS_DB"] = args.db
+
+    now = int(time.time())
+    # spread the expiries evenly, as tokens revoked over one lifetime would be
+    tokens = [
+        (str(uuid.uuid4()), now + 60 + i * args.lifetime // args.tokens)
+        for i in range(args.tokens)
+    ]
+
+    with app.app_context():
+        print(f"{'storage':<10}{'keys':>10}{'bytes':>14}{'bytes/token':>14}")
+        for storage in ("keys", "buckets"):
+            used, keys = measure(app, storage, tokens, args.batch)
+            print(f"{storage:<10}{keys:>10}{used:>14}{used / args.tokens:>14.1f}")
+        connect_with_redis().flushdb()
+
+
+if __name__ == "__main__":
+    main()
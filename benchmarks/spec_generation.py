@@ -0,0 +1,82 @@
+"""Time OpenAPI path registration as the number of routes grows
+
+Compares the upstream ``FlaskPlugin``, which scans ``app.view_functions`` for every view,
+with the indexed ``FlaskRestfulPlugin``. Both the rule lookups alone and the whole
+registration, which also parses every docstring, are timed:
+
+    python -m benchmarks.spec_generation --routes 100 500 1000 3000
+"""
+import argparse
+import time
+
+from apispec import APISpec
+from apispec_webframeworks.flask import FlaskPlugin
+from flask import Flask
+
+from common.apispec import FlaskRestfulPlugin
+
+
+def make_view(i):
+    def view():
+        return ""
+
+    view.__name__ = f"view_{i}"
+    view.__doc__ = f"""View {i}
+
+    ---
+    get:
+      responses:
+        200:
+          description: ok
+    """
+    return view
+
+
+def make_app(routes):
+    app = Flask(__name__)
+    views = []
+    for i in range(routes):
+        view = make_view(i)
+        app.add_url_rule(f"/resources/{i}/<int:item_id>", view_func=view)
+        views.append(view)
+    return app, views
+
+
+def lookup_all(lookup, app, views):
+    started = time.perf_counter()
+    for view in views:
+        lookup(view, app=app)
+    return time.perf_counter() - started
+
+
+def register_all(plugin, app, views):
+    spec = APISpec(title="bench", version="1", openapi_version="3.0.2", plugins=[plugin])
+    started = time.perf_counter()
+    for view in views:
+        spec.path(view=view, app=app)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--routes", type=int, nargs="+", default=[100, 500, 1000, 3000])
+    args = parser.parse_args()
+
+    print(
+        f"{'routes':>8}{'lookup scan':>14}{'lookup index':>14}"
+        f"{'register scan':>15}{'register index':>16}"
+    )
+    for routes in args.routes:
+        app, views = make_app(routes)
+        lookup_scan = lookup_all(FlaskPlugin._rule_for_view, app, views)
+        lookup_index = lookup_all(FlaskRestfulPlugin().rules_for_view, app, views)
+        register_scan = register_all(FlaskPlugin(), app, views)
+        register_index = register_all(FlaskRestfulPlugin(), app, views)
+        print(
+            f"{routes:>8}{lookup_scan:>13.3f}s{lookup_index:>13.3f}s"
+            f"{register_scan:>14.3f}s{register_index:>15.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
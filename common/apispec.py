@@ -1,40 +1,90 @@
-from flask import jsonify, render_template, Blueprint
-from apispec import APISpec
+import gzip
+import hashlib
+import json
+import os
+import weakref
+
+import click
+from flask import current_app, render_template, request, Blueprint
+from flask.cli import with_appcontext
+from flask.views import MethodView
+from apispec import APISpec, yaml_utils
 from apispec.exceptions import APISpecError
 from apispec.ext.marshmallow import MarshmallowPlugin
 from apispec_webframeworks.flask import FlaskPlugin
 
+from common.response import etagged
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
 
 class FlaskRestfulPlugin(FlaskPlugin):
     """Small plugin override to handle flask-restful resources
-    """
 
-    @staticmethod
-    def _rule_for_view(view, app=None):
-        view_funcs = app.view_functions
-        endpoint = None
+    Rules are looked up in a view -> rules index built once per app from ``app.url_map``,
+    rebuilt only when rules are added. A view may be served by several rules, pass
+    ``rule`` to ``spec.path`` to document a specific one, by default the first is used.
+    """
 
-        for ept, view_func in view_funcs.items():
-            if hasattr(view_func, "view_class"):
-                view_func = view_func.view_class
+    def __init__(self):
+        super(FlaskRestfulPlugin, self).__init__()
+        self._indexes = weakref.WeakKeyDictionary()
 
-            if view_func == view:
-                endpoint = ept
+    def rules_for_view(self, view, app=None):
+        if app is None:
+            app = current_app._get_current_object()
 
-        if not endpoint:
+        rules = self._view_index(app).get(view)
+        if not rules:
             raise APISpecError("Could not find endpoint for view {0}".format(view))
-
-        # WARNING: Assume 1 rule per view function for now
-        rule = app.url_map._rules_by_endpoint[endpoint][0]
-        return rule
+        return rules
+
+    def _view_index(self, app):
+        rule_count = len(app.url_map._rules)
+        cached = self._indexes.get(app)
+        if cached is not None and cached[0] == rule_count:
+            return cached[1]
+
+        index = {}
+        for rule in app.url_map.iter_rules():
+            view_func = app.view_functions.get(rule.endpoint)
+            if view_func is None:
+                continue
+            view = getattr(view_func, "view_class", view_func)
+            index.setdefault(view, []).append(rule)
+        self._indexes[app] = (rule_count, index)
+        return index
+
+    def path_helper(self, operations, *, view, app=None, rule=None, **kwargs):
+        if rule is None:
+            rule = self.rules_for_view(view, app=app)[0]
+        operations.update(yaml_utils.load_operations_from_docstring(view.__doc__))
+        if hasattr(view, "view_class") and issubclass(view.view_class, MethodView):
+            for method in view.methods:
+                if method in rule.methods:
+                    method_name = method.lower()
+                    method = getattr(view.view_class, method_name)
+                    operations[method_name] = yaml_utils.load_yaml_from_docstring(
+                        method.__doc__
+                    )
+        return self.flaskpath2openapi(rule.rule)
 
 
 class APISpecExt:
     """Very simple and small extension to use apispec with this API as a flask extension
+
+    The document is serialized once, by ``build`` or on the first hit, and served from
+    memory with a strong ETag, ``Cache-Control`` and pre-compressed gzip/brotli bodies.
+    Call ``build`` again after changing ``spec``.
     """
 
     def __init__(self, app=None, **kwargs):
         self.spec = None
+        self.plugin = None
+        self.document = None
 
         if app is not None:
             self.init_app(app, **kwargs)
@@ -46,12 +96,14 @@ class APISpecExt:
         app.config.setdefault("SWAGGER_JSON_URL", "/swagger.json")
         app.config.setdefault("SWAGGER_UI_URL", "/swagger-ui")
         app.config.setdefault("SWAGGER_URL_PREFIX", None)
+        app.config.setdefault("SWAGGER_CACHE_MAX_AGE", 300)
 
+        self.plugin = FlaskRestfulPlugin()
         self.spec = APISpec(
             title=app.config["APISPEC_TITLE"],
             version=app.config["APISPEC_VERSION"],
             openapi_version=app.config["OPENAPI_VERSION"],
-            plugins=[MarshmallowPlugin(), FlaskRestfulPlugin()],
+            plugins=[MarshmallowPlugin(), self.plugin],
             **kwargs
         )
 
@@ -70,9 +122,71 @@ class APISpecExt:
         )
 
         app.register_blueprint(blueprint)
+        app.extensions["apispec"] = self
+        app.cli.add_command(openapi_command)
+
+    def register_view(self, view, app=None):
+        """Add the paths of every rule serving ``view`` to the spec"""
+        for rule in self.plugin.rules_for_view(view, app=app):
+            self.spec.path(view=view, app=app, rule=rule)
+
+    def build(self):
+        """Serialize and compress the spec, returns the encoded bodies by content coding"""
+        body = json.dumps(self.spec.to_dict(), sort_keys=True, separators=(",", ":"))
+        body = body.encode("utf-8")
+        document = {
+            "identity": body,
+            "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+        }
+        if brotli is not None:
+            document["br"] = brotli.compress(body)
+        document["etag"] = hashlib.sha256(body).hexdigest()
+        self.document = document
+        return document
 
     def swagger_json(self):
-        return jsonify(self.spec.to_dict())
+        document = self.document or self.build()
+        encoding = "identity"
+        for candidate in ("br", "gzip"):
+            if candidate in document and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        # each content coding is a distinct representation, hence a distinct strong ETag
+        etag = document["etag"] if encoding == "identity" else f"{document['etag']}-{encoding}"
+        headers = {
+            "Cache-Control": "public, max-age={0}".format(
+                current_app.config["SWAGGER_CACHE_MAX_AGE"]
+            ),
+            "Vary": "Accept-Encoding",
+        }
+        response = etagged(etag, document[encoding], headers=headers)
+        if response.status_code == 200 and encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        return response
 
     def swagger_ui(self):
         return render_template("swagger.j2")
+
+
+@click.command("openapi")
+@click.option(
+    "--output", default="swagger.json", show_default=True, help="file to write the spec to"
+)
+@click.option(
+    "--compress/--no-compress",
+    default=True,
+    help="also write the .gz (and .br if brotli is installed) variants",
+)
+@with_appcontext
+def openapi_command(output, compress):
+    """Write the OpenAPI document to disk, e.g. for static hosting"""
+    document = current_app.extensions["apispec"].build()
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    suffixes = {"identity": "", "gzip": ".gz", "br": ".br"}
+    for encoding, suffix in suffixes.items():
+        if encoding not in document or (suffix and not compress):
+            continue
+        with open(output + suffix, "wb") as f:
+            f.write(document[encoding])
+        click.echo(f"wrote {output + suffix}")
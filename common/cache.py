@@ -0,0 +1,131 @@
+import hashlib
+import json
+import threading
+import time
+import zlib
+from functools import wraps
+
+import redis
+from flask import current_app, request
+from flask_jwt_extended import get_jwt_identity
+from flask_restful.utils import unpack
+from werkzeug.wrappers import BaseResponse
+
+from common.response import dumps, etagged
+from models.redis_models.redis_model import connect_with_redis
+
+
+class ResponseCache(object):
+    """Caches the serialized responses of ``Resource.get`` methods in Redis.
+
+    Entries are keyed on path, query string, JWT identity and the current version of
+    their tags; ``invalidate`` bumps the version of a tag, so every entry carrying it is
+    missed from then on and left to expire. Concurrent misses of one key are coalesced:
+    one thread per worker, and one worker thanks to a Redis lock, computes the response
+    while the others wait for it. Responses carry an ETag and matching conditional
+    requests get a 304.
+
+    Only 200 responses are cached; streamed responses, requests for which ``unless``
+    returns True and Redis errors bypass the cache.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._locks = [threading.Lock() for _ in range(64)]
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("RESPONSE_CACHE_ENABLED", True)
+        app.config.setdefault("RESPONSE_CACHE_TTL", 60)
+        app.config.setdefault("RESPONSE_CACHE_PREFIX", "response")
+        app.config.setdefault("RESPONSE_CACHE_LOCK_TIMEOUT", 5.0)
+        app.config.setdefault("RESPONSE_CACHE_POLL_INTERVAL", 0.05)
+        self.app = app
+
+    def cached(self, tags=(), ttl=None, unless=None):
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if not current_app.config["RESPONSE_CACHE_ENABLED"] or (
+                    unless is not None and unless()
+                ):
+                    return f(*args, **kwargs)
+                try:
+                    client = connect_with_redis()
+                    key = self._key(client, tags)
+                    entry = client.get(key)
+                    if entry is None:
+                        # one thread per worker computes, the others find its entry
+                        with self._locks[zlib.crc32(key.encode()) % len(self._locks)]:
+                            entry = client.get(key)
+                            if entry is None:
+                                entry, rv = self._fill(client, key, f, args, kwargs, ttl)
+                                if entry is None:
+                                    return rv
+                except redis.RedisError as e:
+                    current_app.logger.warning(f"response cache unavailable: {str(e)}")
+                    return f(*args, **kwargs)
+                return self._respond(entry)
+
+            return wrapper
+
+        return decorator
+
+    def invalidate(self, *tags):
+        try:
+            pipe = connect_with_redis().pipeline(transaction=False)
+            for tag in tags:
+                pipe.incr(self._tag_key(tag))
+            pipe.execute()
+        except redis.RedisError as e:
+            # the entries will be served until RESPONSE_CACHE_TTL expires them
+            current_app.logger.warning(f"response cache invalidation failed: {str(e)}")
+
+    def _tag_key(self, tag):
+        return f"{current_app.config['RESPONSE_CACHE_PREFIX']}:tag:{tag}"
+
+    def _key(self, client, tags):
+        versions = client.mget([self._tag_key(tag) for tag in tags]) if tags else []
+        identity = json.dumps(get_jwt_identity(), sort_keys=True)
+        query = sorted(request.args.items(multi=True))
+        raw = json.dumps([request.host_url, request.path, query, identity, versions])
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return f"{current_app.config['RESPONSE_CACHE_PREFIX']}:{digest}"
+
+    def _fill(self, client, key, f, args, kwargs, ttl):
+        """Return ``(entry, None)``, or ``(None, rv)`` when the response is not cacheable"""
+        config = current_app.config
+        lock_key = key + ":lock"
+        lock_timeout = config["RESPONSE_CACHE_LOCK_TIMEOUT"]
+        locked = client.set(lock_key, 1, nx=True, px=int(lock_timeout * 1000))
+        if not locked:
+            # another worker is computing it, wait for its entry rather than stampede
+            deadline = time.monotonic() + lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(config["RESPONSE_CACHE_POLL_INTERVAL"])
+                entry = client.get(key)
+                if entry is not None:
+                    return entry, None
+
+        try:
+            rv = f(*args, **kwargs)
+            if isinstance(rv, BaseResponse):
+                return None, rv
+            data, code, headers = unpack(rv)
+            if code != 200 or headers:
+                return None, rv
+            body = dumps(data).decode("utf-8")
+            etag = hashlib.sha1(body.encode("utf-8")).hexdigest()
+            entry = f"{etag}\n{body}"
+            client.set(key, entry, ex=ttl or config["RESPONSE_CACHE_TTL"])
+            return entry, None
+        finally:
+            if locked:
+                client.delete(lock_key)
+
+    @staticmethod
+    def _respond(entry):
+        etag, body = entry.split("\n", 1)
+        return etagged(etag, body)
@@ -0,0 +1,111 @@
+import time
+from contextlib import contextmanager
+
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool
+
+REPLICA_BIND = "replica"
+
+
+class TimedQueuePool(QueuePool):
+    """``QueuePool`` counting checkouts and the time spent getting a connection, which
+    includes waiting for a free one when the pool and its overflow are exhausted."""
+
+    def __init__(self, *args, **kwargs):
+        super(TimedQueuePool, self).__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        connection = super(TimedQueuePool, self)._do_get()
+        waited = time.perf_counter() - started
+        self.checkouts += 1
+        self.wait_seconds += waited
+        if waited > self.max_wait_seconds:
+            self.max_wait_seconds = waited
+        return connection
+
+    def stats(self):
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "overflow": max(0, self.overflow()),
+            "checkouts": self.checkouts,
+            "wait_seconds_total": self.wait_seconds,
+            "wait_seconds_max": self.max_wait_seconds,
+        }
+
+
+class RoutingSession(SignallingSession):
+    """Session sending the queries of ``SQLAlchemy.read_replica`` blocks to the replica.
+
+    Once the session has flushed, every query stays on the primary until the session is
+    removed at the end of the request, so a request reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.info.get("replica") and not self.info.get("wrote") and not self._flushing:
+            if REPLICA_BIND in (self.app.config["SQLALCHEMY_BINDS"] or {}):
+                return get_state(self.app).db.get_engine(self.app, bind=REPLICA_BIND)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def stick_to_primary(session, flush_context):
+    session.info["wrote"] = True
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """``SQLAlchemy`` with replica routing and timed connection pools.
+
+    Configure the replica as the ``replica`` entry of ``SQLALCHEMY_BINDS``, without it
+    ``read_replica`` blocks run on the primary. ``SQLALCHEMY_STATEMENT_TIMEOUT``
+    (milliseconds) is set on the PostgreSQL and MySQL connections.
+    """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        if sa_url.drivername.startswith("sqlite"):
+            # sqlite runs on a NullPool or a StaticPool, neither takes sizes
+            for option in ("pool_size", "max_overflow", "pool_timeout"):
+                engine_opts.pop(option, None)
+            return super(RoutingSQLAlchemy, self).create_engine(sa_url, engine_opts)
+
+        engine_opts.setdefault("poolclass", TimedQueuePool)
+        timeout = self.get_app().config.get("SQLALCHEMY_STATEMENT_TIMEOUT")
+        if timeout:
+            connect_args = engine_opts.setdefault("connect_args", {})
+            if sa_url.drivername.startswith("postgresql"):
+                connect_args["options"] = f"-c statement_timeout={int(timeout)}"
+            elif sa_url.drivername.startswith("mysql"):
+                connect_args["init_command"] = f"SET SESSION max_execution_time={int(timeout)}"
+        return super(RoutingSQLAlchemy, self).create_engine(sa_url, engine_opts)
+
+    @contextmanager
+    def read_replica(self):
+        """Run the queries of the block on the replica, unless the session already wrote"""
+        session = self.session()
+        previous = session.info.get("replica", False)
+        session.info["replica"] = True
+        try:
+            yield
+        finally:
+            session.info["replica"] = previous
+
+
+def db_pool_stats(app):
+    """Counters of the connection pools created so far by the app, by bind"""
+    state = app.extensions.get("sqlalchemy")
+    if state is None:
+        return {}
+    stats = {}
+    for bind, connector in list(state.connectors.items()):
+        pool = connector.get_engine().pool
+        if isinstance(pool, TimedQueuePool):
+            stats[bind or "primary"] = pool.stats()
+    return stats
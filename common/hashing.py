@@ -0,0 +1,226 @@
+import concurrent.futures
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from passlib.context import CryptContext
+from passlib.hash import pbkdf2_sha256
+
+from common.process import PerProcess
+from common.response import Response
+
+
+_worker_context = None
+
+
+def _init_worker(context_config):
+    global _worker_context
+    _worker_context = CryptContext.from_string(context_config)
+
+
+def _hash(secret):
+    return _worker_context.hash(secret)
+
+
+def _verify(secret, hashed):
+    return _worker_context.verify(secret, hashed)
+
+
+def _verify_and_update(secret, hashed):
+    return _worker_context.verify_and_update(secret, hashed)
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool already has ``HASHING_QUEUE_DEPTH`` calls in flight, or
+    could not answer within ``HASHING_TIMEOUT``"""
+
+    def __init__(self, retry_after):
+        super(HashingBusy, self).__init__("password hashing pool is saturated")
+        self.retry_after = retry_after
+
+
+class HashingService(object):
+    """Runs the password hashing calls of a passlib ``CryptContext`` on a process pool.
+
+    pbkdf2 is pure CPU and holds the GIL, running it in the request thread stalls every
+    other request of the worker. Calls are handed to a pool of
+    ``HASHING_POOL_SIZE`` processes instead; once ``HASHING_QUEUE_DEPTH`` calls are in
+    flight new ones fail fast with ``HashingBusy``, answered with a 503 and Retry-After.
+    A call counts as in flight until the pool is done with it, even when its caller gave
+    up after ``HASHING_TIMEOUT``. A pool that lost one of its processes is replaced.
+
+    Each gunicorn worker has its own pool, size it so that ``GUNICORN_WORKERS`` times
+    ``HASHING_POOL_SIZE`` does not exceed the cores of the host.
+
+    Outside of an application context, or with ``HASHING_POOL_ENABLED`` off, calls run
+    inline.
+
+    ``PBKDF2_ROUNDS`` sets the rounds of new hashes and the minimum accepted for existing
+    ones: hashes below it are flagged by ``verify_and_update`` to be rehashed. Use the
+    ``flask bench-hashing`` command to pick a value for the host.
+    """
+
+    def __init__(self, context, app=None):
+        self.context = context
+        self.app = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._process = PerProcess(self._start_pool)
+        self.stats = {
+            "calls": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "seconds_total": 0.0,
+            "seconds_max": 0.0,
+        }
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("HASHING_POOL_ENABLED", True)
+        app.config.setdefault("HASHING_POOL_SIZE", 1)
+        app.config.setdefault("HASHING_QUEUE_DEPTH", 4 * app.config["HASHING_POOL_SIZE"])
+        app.config.setdefault("HASHING_TIMEOUT", 10)
+        app.config.setdefault("HASHING_RETRY_AFTER", 1)
+        app.config.setdefault("PBKDF2_ROUNDS", None)
+        if app.config["PBKDF2_ROUNDS"]:
+            self.context.update(
+                pbkdf2_sha256__default_rounds=app.config["PBKDF2_ROUNDS"],
+                pbkdf2_sha256__min_rounds=app.config["PBKDF2_ROUNDS"],
+            )
+        self.app = app
+        app.extensions["hashing"] = self
+        app.register_error_handler(HashingBusy, self.handle_busy)
+        app.cli.add_command(bench_hashing_command)
+
+    def hash(self, secret):
+        return self._call(_hash, self.context.hash, secret)
+
+    def verify(self, secret, hashed):
+        return self._call(_verify, self.context.verify, secret, hashed)
+
+    def verify_and_update(self, secret, hashed):
+        """
+        Verify ``secret`` and, if the hash uses outdated settings, return its replacement
+        from the same computation: ``(valid, new_hash or None)``.
+        """
+        return self._call(
+            _verify_and_update, self.context.verify_and_update, secret, hashed
+        )
+
+    def handle_busy(self, e):
+        response_body = {"message": "server busy, retry later"}
+        return (
+            Response(503).wrap(response_body=response_body),
+            HTTPStatus.SERVICE_UNAVAILABLE,
+            {"Retry-After": str(e.retry_after)},
+        )
+
+    def _call(self, pooled, inline, *args):
+        started = time.perf_counter()
+        if self.app is None or not has_app_context() or not current_app.config[
+            "HASHING_POOL_ENABLED"
+        ]:
+            result = inline(*args)
+        else:
+            result = self._call_pool(pooled, *args)
+        self._record(inline.__name__, time.perf_counter() - started)
+        return result
+
+    def _call_pool(self, pooled, *args):
+        executor = self._get_executor()
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self.stats["rejected"] += 1
+            raise HashingBusy(current_app.config["HASHING_RETRY_AFTER"])
+        try:
+            try:
+                future = executor.submit(pooled, *args)
+            except BrokenProcessPool:
+                executor = self._replace_executor(executor)
+                future = executor.submit(pooled, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # the slot is held until the pool is done with the call, not until we stop waiting
+        future.add_done_callback(lambda f: slots.release())
+
+        try:
+            return future.result(timeout=current_app.config["HASHING_TIMEOUT"])
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self.stats["timeouts"] += 1
+            raise HashingBusy(current_app.config["HASHING_RETRY_AFTER"])
+        except BrokenProcessPool:
+            # one of the processes died (OOM killer, ...), the pool takes no more calls
+            self._replace_executor(executor)
+            raise HashingBusy(current_app.config["HASHING_RETRY_AFTER"])
+
+    def _record(self, operation, elapsed):
+        self.stats["calls"] += 1
+        self.stats["seconds_total"] += elapsed
+        if elapsed > self.stats["seconds_max"]:
+            self.stats["seconds_max"] = elapsed
+        if self.app is not None:
+            self.app.logger.debug(f"password hashing call took {elapsed * 1000:.1f}ms")
+            metrics = self.app.extensions.get("metrics")
+            if metrics is not None:
+                metrics.observe("pbkdf2", operation, elapsed)
+
+    def _get_executor(self):
+        self._process.ensure()
+        return self._executor
+
+    def _start_pool(self):
+        self._executor = self._new_executor()
+        self._slots = threading.BoundedSemaphore(self.app.config["HASHING_QUEUE_DEPTH"])
+
+    def _replace_executor(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                self.app.logger.warning("password hashing pool broken, starting a new one")
+                broken.shutdown(wait=False)
+                self._executor = self._new_executor()
+            return self._executor
+
+    def _new_executor(self):
+        # forking a worker which already runs the cache, audit and profiler threads can
+        # deadlock the child on a lock held by one of them, start from a clean server
+        return ProcessPoolExecutor(
+            max_workers=self.app.config["HASHING_POOL_SIZE"],
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=_init_worker,
+            initargs=(self.context.to_string(),),
+        )
+
+
+@click.command("bench-hashing")
+@click.option("--target-ms", default=100.0, help="wanted duration of one hash")
+@click.option("--samples", default=5, help="hashes timed per measure")
+@with_appcontext
+def bench_hashing_command(target_ms, samples):
+    """Find the pbkdf2_sha256 rounds matching a target latency on this host"""
+    context = current_app.extensions["hashing"].context
+
+    def measure(rounds):
+        hasher = pbkdf2_sha256.using(rounds=rounds)
+        started = time.perf_counter()
+        for _ in range(samples):
+            hasher.hash("benchmark password")
+        return (time.perf_counter() - started) * 1000 / samples
+
+    rounds = context.handler("pbkdf2_sha256").default_rounds
+    # pbkdf2 cost is linear in rounds, two corrections are enough to converge
+    for _ in range(3):
+        elapsed = measure(rounds)
+        click.echo(f"{rounds:>10} rounds: {elapsed:8.1f}ms")
+        rounds = max(pbkdf2_sha256.min_rounds, int(rounds * target_ms / elapsed))
+    click.echo(f"PBKDF2_ROUNDS={rounds}")
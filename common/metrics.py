@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from common.database import db_pool_stats
+from models.redis_models.redis_model import (
+    CircuitBreaker,
+    redis_breaker_state,
+    redis_pool_stats,
+)
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # pragma: no cover
+    prometheus_client = None
+
+
+# dependency calls are much faster than requests, the default buckets start at 5ms
+DEPENDENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+
+
+def multiprocess_dir():
+    """Directory shared by the gunicorn workers for their metrics, None if not set"""
+    return os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")
+
+
+class Metrics(object):
+    """Prometheus metrics of the application, exported at ``METRICS_URL``.
+
+    Records the latency and status of every request by endpoint, and the time spent in
+    dependencies: SQL statements, Redis calls wrapped in ``timer`` and password hashing.
+    Under gunicorn, set ``PROMETHEUS_MULTIPROC_DIR`` to an empty directory so that the
+    workers write their samples there and the export sums them; ``gunicorn.conf.py``
+    cleans up after dead workers.
+
+    Needs the optional ``prometheus_client`` package, without it nothing is recorded.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.request_latency = None
+        self.requests = None
+        self.dependency_latency = None
+        self.redis_pool = None
+        self.redis_circuit_open = None
+        self.db_pool = None
+        self.db_pool_checkouts = None
+        self.db_pool_wait = None
+        self._lock = threading.Lock()
+        self._db_pool_seen = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("METRICS_ENABLED", True)
+        app.config.setdefault("METRICS_URL", "/metrics")
+        self.app = app
+        app.extensions["metrics"] = self
+        if prometheus_client is None or not app.config["METRICS_ENABLED"]:
+            return
+
+        if self.request_latency is None:
+            # collectors register globally, once per process whatever the number of apps
+            self._create_collectors()
+        self.enabled = True
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule(app.config["METRICS_URL"], "metrics", self.export)
+
+    def _create_collectors(self):
+        self.request_latency = prometheus_client.Histogram(
+            "http_request_duration_seconds",
+            "Latency of the requests by endpoint",
+            ["endpoint", "method"],
+        )
+        self.requests = prometheus_client.Counter(
+            "http_requests_total",
+            "Requests by endpoint and status code",
+            ["endpoint", "method", "status"],
+        )
+        self.dependency_latency = prometheus_client.Histogram(
+            "dependency_call_duration_seconds",
+            "Time spent in calls to Redis, the database and password hashing",
+            ["dependency", "operation"],
+            buckets=DEPENDENCY_BUCKETS,
+        )
+        self.redis_pool = prometheus_client.Gauge(
+            "redis_pool_connections",
+            "Connections of the Redis pools by state",
+            ["state"],
+            multiprocess_mode="livesum",
+        )
+        self.redis_circuit_open = prometheus_client.Gauge(
+            "redis_circuit_open",
+            "Workers whose Redis circuit breaker is not closed",
+            multiprocess_mode="livesum",
+        )
+        self.db_pool = prometheus_client.Gauge(
+            "db_pool_connections",
+            "Connections of the database pools by bind and state",
+            ["bind", "state"],
+            multiprocess_mode="livesum",
+        )
+        self.db_pool_checkouts = prometheus_client.Counter(
+            "db_pool_checkouts",
+            "Connections taken from the database pools",
+            ["bind"],
+        )
+        self.db_pool_wait = prometheus_client.Counter(
+            "db_pool_wait_seconds",
+            "Time spent getting connections from the database pools",
+            ["bind"],
+        )
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(Engine, "handle_error", self._handle_error)
+
+    def observe(self, dependency, operation, seconds):
+        if self.enabled:
+            self.dependency_latency.labels(dependency, operation).observe(seconds)
+
+    @contextmanager
+    def timer(self, dependency, operation):
+        """Time the calls made in the block, e.g. ``with metrics.timer("redis", "revoke")``"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(dependency, operation, time.perf_counter() - started)
+
+    def export(self):
+        if multiprocess_dir():
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prometheus_client.REGISTRY
+        return (
+            prometheus_client.generate_latest(registry),
+            200,
+            {"Content-Type": prometheus_client.CONTENT_TYPE_LATEST},
+        )
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or "unmatched"
+        self.request_latency.labels(endpoint, request.method).observe(
+            time.perf_counter() - started
+        )
+        self.requests.labels(endpoint, request.method, response.status_code).inc()
+
+        stats = redis_pool_stats()
+        if stats:
+            self.redis_pool.labels("in_use").set(stats["in_use"])
+            self.redis_pool.labels("idle").set(stats["idle"])
+        self.redis_circuit_open.set(redis_breaker_state() != CircuitBreaker.CLOSED)
+        for bind, stats in db_pool_stats(current_app).items():
+            self.db_pool.labels(bind, "checked_out").set(stats["checked_out"])
+            self.db_pool.labels(bind, "overflow").set(stats["overflow"])
+            checkouts, wait_seconds = self._db_pool_increase(bind, stats)
+            self.db_pool_checkouts.labels(bind).inc(checkouts)
+            self.db_pool_wait.labels(bind).inc(wait_seconds)
+        return response
+
+    def _db_pool_increase(self, bind, stats):
+        """What the cumulative pool counters of ``bind`` grew by since the last request"""
+        # a forked worker starts new pools, counting from zero
+        key = (os.getpid(), bind)
+        current = (stats["checkouts"], stats["wait_seconds_total"])
+        with self._lock:
+            seen = self._db_pool_seen.get(key, (0, 0.0))
+            if current[0] <= seen[0]:
+                # another request already accounted for these, or for more
+                return 0, 0.0
+            self._db_pool_seen[key] = current
+        return current[0] - seen[0], max(0.0, current[1] - seen[1])
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        # the verb only, labels must stay few
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else ""
+        self.observe("sql", operation, time.perf_counter() - started)
+
+    def _handle_error(self, context):
+        if context.connection is not None:
+            started = context.connection.info.get("metrics_started")
+            if started:
+                started.pop()
@@ -0,0 +1,35 @@
+import os
+import threading
+
+
+class PerProcess(object):
+    """Runs ``setup`` once in each process, on the first ``ensure`` made there.
+
+    A forked gunicorn worker inherits the state of its parent but none of its threads, nor
+    can it use the parent's process pools: ``setup`` starts them again in every worker.
+    """
+
+    def __init__(self, setup):
+        self.setup = setup
+        self.pid = None
+        self._lock = threading.Lock()
+        # another thread of the parent may have held the lock when it forked
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    @property
+    def current(self):
+        """Whether ``setup`` already ran in this process"""
+        return self.pid == os.getpid()
+
+    def ensure(self):
+        pid = os.getpid()
+        if self.pid == pid:
+            return
+        with self._lock:
+            if self.pid == pid:
+                return
+            self.setup()
+            self.pid = pid
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
@@ -0,0 +1,212 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+
+import click
+import redis
+from flask import current_app, request
+from flask.cli import with_appcontext
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from common.process import PerProcess
+from common.response import Response
+from models.redis_models.redis_model import connect_with_redis
+
+
+class Profiler(object):
+    """Statistical profiler of the requests, aggregated as collapsed stacks.
+
+    A request is profiled when a random draw falls under ``PROFILING_SAMPLE_RATIO`` or
+    when it carries a token signed with ``SECRET_KEY`` in the ``PROFILING_HEADER`` header
+    (``flask profiling-token`` issues one). While a request is profiled, a sampler
+    thread reads its stack every ``PROFILING_INTERVAL`` seconds through
+    ``sys._current_frames``; the JWT callbacks, password hashing and response
+    serialization show up there like any other frame. With no request profiled the
+    sampler sleeps, the only cost left is the draw in ``before_request``.
+
+    Every ``PROFILING_FLUSH_INTERVAL`` seconds the sampler adds the stacks it counted to
+    the ``PROFILING_REDIS_KEY`` hash, so the stacks of all the gunicorn workers are
+    aggregated. ``GET PROFILING_URL`` returns them in the collapsed format of
+    flamegraph.pl and speedscope, ``DELETE`` clears them; both need the signed header.
+    Without Redis, the stacks of the worker answering are returned, its pid in the
+    ``X-Profile-Pid`` header.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._targets = {}
+        self._stacks = Counter()
+        self._process = PerProcess(self._start_sampler)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("PROFILING_ENABLED", True)
+        app.config.setdefault("PROFILING_SAMPLE_RATIO", 0.0)
+        app.config.setdefault("PROFILING_INTERVAL", 0.005)
+        app.config.setdefault("PROFILING_HEADER", "X-Profile")
+        app.config.setdefault("PROFILING_TOKEN_MAX_AGE", 3600)
+        app.config.setdefault("PROFILING_MAX_STACKS", 10000)
+        app.config.setdefault("PROFILING_URL", "/admin/profile")
+        app.config.setdefault("PROFILING_FLUSH_INTERVAL", 1.0)
+        app.config.setdefault("PROFILING_REDIS_KEY", "profiling:stacks")
+        app.config.setdefault("PROFILING_REDIS_TTL", 86400)
+        self.app = app
+        app.extensions["profiling"] = self
+        app.cli.add_command(profiling_token_command)
+        if not app.config["PROFILING_ENABLED"]:
+            return
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule(
+            app.config["PROFILING_URL"],
+            "profile",
+            self.profile,
+            methods=["GET", "DELETE"],
+        )
+
+    def serializer(self):
+        return URLSafeTimedSerializer(self.app.config["SECRET_KEY"], salt="profiling")
+
+    def is_authorized(self):
+        token = request.headers.get(self.app.config["PROFILING_HEADER"])
+        if not token:
+            return False
+        try:
+            self.serializer().loads(
+                token, max_age=self.app.config["PROFILING_TOKEN_MAX_AGE"]
+            )
+        except BadSignature:
+            return False
+        return True
+
+    def profile(self):
+        if not self.is_authorized():
+            response_body = {"message": "a signed profiling token is required"}
+            return Response(403).wrap(response_body=response_body), HTTPStatus.FORBIDDEN
+        key = self.app.config["PROFILING_REDIS_KEY"]
+        if request.method == "DELETE":
+            with self._lock:
+                self._stacks.clear()
+            try:
+                connect_with_redis().delete(key)
+            except redis.RedisError as e:
+                self.app.logger.warning(f"profiling stacks not cleared: {str(e)}")
+            return "", HTTPStatus.NO_CONTENT
+
+        headers = {"Content-Type": "text/plain; charset=utf-8"}
+        try:
+            self._flush()
+            stacks = Counter(
+                {
+                    stack: int(count)
+                    for stack, count in connect_with_redis().hgetall(key).items()
+                }
+            )
+        except redis.RedisError as e:
+            self.app.logger.warning(f"profiling stacks of this worker only: {str(e)}")
+            with self._lock:
+                stacks = Counter(self._stacks)
+            headers["X-Profile-Pid"] = str(os.getpid())
+        body = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        return body, HTTPStatus.OK, headers
+
+    def _before_request(self):
+        ratio = self.app.config["PROFILING_SAMPLE_RATIO"]
+        if not (ratio and random.random() < ratio) and not (
+            self.app.config["PROFILING_HEADER"] in request.headers and self.is_authorized()
+        ):
+            return
+        self._process.ensure()
+        with self._lock:
+            self._targets[threading.get_ident()] = request.endpoint or "unmatched"
+            self._active.set()
+
+    def _teardown_request(self, exc):
+        ident = threading.get_ident()
+        if ident not in self._targets:
+            return
+        with self._lock:
+            self._targets.pop(ident, None)
+            if not self._targets:
+                self._active.clear()
+
+    def _start_sampler(self):
+        with self._lock:
+            self._targets = {}
+            self._active = threading.Event()
+        thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        thread.start()
+
+    def _sample(self):
+        interval = self.app.config["PROFILING_INTERVAL"]
+        max_stacks = self.app.config["PROFILING_MAX_STACKS"]
+        flush_interval = self.app.config["PROFILING_FLUSH_INTERVAL"]
+        flushed = time.monotonic()
+        while True:
+            active = self._active.wait(timeout=flush_interval)
+            if time.monotonic() - flushed >= flush_interval:
+                try:
+                    with self.app.app_context():
+                        self._flush()
+                except redis.RedisError as e:
+                    # kept locally and added to the hash on the next flush
+                    self.app.logger.warning(f"profiling stacks not flushed: {str(e)}")
+                flushed = time.monotonic()
+            if not active:
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, endpoint in self._targets.items():
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stack = collapse(frame, endpoint)
+                    if stack in self._stacks or len(self._stacks) < max_stacks:
+                        self._stacks[stack] += 1
+            del frames
+            time.sleep(interval)
+
+    def _flush(self):
+        """Add the stacks counted since the last flush to the shared hash"""
+        with self._lock:
+            stacks, self._stacks = self._stacks, Counter()
+        if not stacks:
+            return
+        key = self.app.config["PROFILING_REDIS_KEY"]
+        try:
+            pipe = connect_with_redis().pipeline(transaction=False)
+            for stack, count in stacks.items():
+                pipe.hincrby(key, stack, count)
+            pipe.expire(key, self.app.config["PROFILING_REDIS_TTL"])
+            pipe.execute()
+        except redis.RedisError:
+            with self._lock:
+                self._stacks.update(stacks)
+            raise
+
+
+def collapse(frame, root):
+    """``root;module:function;...`` from the outermost frame to ``frame``"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+        frame = frame.f_back
+    names.append(root)
+    return ";".join(reversed(names))
+
+
+@click.command("profiling-token")
+@with_appcontext
+def profiling_token_command():
+    """Print a token to send in PROFILING_HEADER, valid PROFILING_TOKEN_MAX_AGE seconds"""
+    click.echo(current_app.extensions["profiling"].serializer().dumps("profile"))
@@ -0,0 +1,160 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+
+import jwt
+import redis
+from flask import request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request_optional
+from flask_jwt_extended.exceptions import JWTExtendedException
+
+from common.response import Response
+from models.redis_models.redis_model import connect_with_redis
+
+
+# Sliding window counter: the previous window counts for the part of it still inside the
+# sliding window. Grants up to ARGV[4] permits at once so callers can spend them locally.
+SLIDING_WINDOW_LUA = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local used = math.floor(previous * tonumber(ARGV[3])) + current
+local granted = math.min(tonumber(ARGV[1]) - used, tonumber(ARGV[4]))
+if granted <= 0 then
+  return 0
+end
+redis.call('INCRBY', KEYS[1], granted)
+redis.call('EXPIRE', KEYS[1], 2 * tonumber(ARGV[2]))
+return granted
+"""
+
+
+def json_field(name):
+    """``name`` of the JSON body, None if the body is not a JSON object"""
+    body = request.get_json(silent=True)
+    return body.get(name) if isinstance(body, dict) else None
+
+
+def jwt_user_id():
+    """
+    Id of the user of the request's access token, None without a valid one: limits run
+    before the view verifies the token, the body would let anyone spend another user's
+    quota.
+    """
+    try:
+        verify_jwt_in_request_optional()
+    except (JWTExtendedException, jwt.PyJWTError):
+        return None
+    identity = get_jwt_identity()
+    return identity.get("id") if isinstance(identity, dict) else identity
+
+
+class RateLimiter(object):
+    """Sliding window rate limits for the routes listed in ``RATELIMITS``.
+
+    ``RATELIMITS`` maps an endpoint to ``(scope, limit, window_seconds)`` rules, the scope
+    naming a registered key function (``ip``, ``username``, ``user_id`` by default). The
+    limits are global: each worker leases batches of permits from an atomic sliding window
+    counter in Redis and spends them locally, and remembers rejections for
+    ``RATELIMIT_DENY_CACHE_SECONDS``, so most decisions make no network call. Leased
+    permits a worker does not use in their window are lost, which errs on the strict side.
+
+    Register ``check`` as a ``before_request`` hook of the blueprints to protect.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._leases = OrderedDict()
+        self._script = None
+        self.key_funcs = {
+            "ip": lambda: request.remote_addr,
+            "username": lambda: json_field("username"),
+            "user_id": jwt_user_id,
+        }
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("RATELIMIT_ENABLED", True)
+        app.config.setdefault("RATELIMITS", {})
+        app.config.setdefault("RATELIMIT_PREFIX", "ratelimit")
+        app.config.setdefault("RATELIMIT_LEASE_RATIO", 0.2)
+        app.config.setdefault("RATELIMIT_DENY_CACHE_SECONDS", 1.0)
+        app.config.setdefault("RATELIMIT_MAX_KEYS", 10000)
+        self.app = app
+
+    def key_func(self, scope):
+        """Register a function returning the value to limit on for ``scope``, or None"""
+
+        def decorator(callback):
+            self.key_funcs[scope] = callback
+            return callback
+
+        return decorator
+
+    def check(self):
+        if not self.app.config["RATELIMIT_ENABLED"]:
+            return None
+        for scope, limit, window in self.app.config["RATELIMITS"].get(request.endpoint, ()):
+            value = self.key_funcs[scope]()
+            if value is None:
+                continue
+            retry_after = self.hit(f"{request.endpoint}:{scope}:{value}", limit, window)
+            if retry_after:
+                response_body = {"message": "too many requests"}
+                return (
+                    Response(429).wrap(response_body=response_body),
+                    HTTPStatus.TOO_MANY_REQUESTS,
+                    {"Retry-After": str(retry_after)},
+                )
+        return None
+
+    def hit(self, key, limit, window):
+        """Take one permit for ``key``, return 0 if allowed or the seconds to wait"""
+        now = time.time()
+        index = int(now // window)
+        retry_after = max(1, math.ceil((index + 1) * window - now))
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None or lease["window"] != index:
+                lease = {"window": index, "permits": 0, "denied_until": 0.0}
+                self._leases[key] = lease
+            self._leases.move_to_end(key)
+            while len(self._leases) > self.app.config["RATELIMIT_MAX_KEYS"]:
+                self._leases.popitem(last=False)
+            if lease["denied_until"] > now:
+                return retry_after
+            if lease["permits"] > 0:
+                lease["permits"] -= 1
+                return 0
+
+        granted = self._acquire(key, limit, window, index, now)
+        with self._lock:
+            if granted == 0:
+                lease["denied_until"] = now + min(
+                    self.app.config["RATELIMIT_DENY_CACHE_SECONDS"], retry_after
+                )
+                return retry_after
+            lease["permits"] += granted - 1
+            return 0
+
+    def _acquire(self, key, limit, window, index, now):
+        prefix = f"{self.app.config['RATELIMIT_PREFIX']}:{key}:"
+        weight = 1 - (now % window) / window
+        lease = max(1, int(limit * self.app.config["RATELIMIT_LEASE_RATIO"]))
+        try:
+            client = connect_with_redis()
+            if self._script is None:
+                self._script = client.register_script(SLIDING_WINDOW_LUA)
+            return self._script(
+                keys=[prefix + str(index), prefix + str(index - 1)],
+                args=[limit, window, weight, lease],
+                client=client,
+            )
+        except redis.RedisError as e:
+            # without Redis the limits can not be shared, let the request through
+            self.app.logger.warning(f"rate limiter unavailable: {str(e)}")
+            return 1
@@ -1,19 +1,80 @@
+import json
+from functools import lru_cache
 from http import HTTPStatus
 
+from flask import current_app, request
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+_encoder = JSONEncoder()
+
+
+def dumps(obj):
+    """Serialize ``obj`` to JSON bytes, with orjson when it is installed.
+
+    Types the stdlib encoder can not handle (dates, UUIDs, ...) are converted, and keys
+    sorted, the way ``flask.jsonify`` does. Non-string keys, such as the indexes of
+    marshmallow's errors on list items, are written as strings.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=_encoder.default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS,
+        )
+    return json.dumps(
+        obj, default=_encoder.default, separators=(",", ":"), sort_keys=True
+    ).encode("utf-8")
+
+
+@lru_cache(maxsize=None)
+def envelope_parts(status):
+    """
+    The serialized envelope around the body for ``status``, keys in the order ``jsonify``
+    would sort them: ``{"code":..,"error":..,"status":..,"success":..}``
+    """
+    status = HTTPStatus(status)
+    phrase = json.dumps(status.phrase)
+    if status.value < 400:
+        head = f'{{"code":{status.value},"error":null,"status":{phrase},"success":'
+        tail = "}"
+    else:
+        head = f'{{"code":{status.value},"error":'
+        tail = f',"status":{phrase},"success":null}}'
+    return head.encode("utf-8"), tail.encode("utf-8")
+
 
 class Response:
 
+    __slots__ = ("code", "head", "tail")
+
     def __init__(self, status: int):
-        self.status = HTTPStatus(status)
-        self.code = status
-        self.success = {}
-        self.error = {}
+        self.code = int(status)
+        self.head, self.tail = envelope_parts(self.code)
 
     def wrap(self, response_body):
-        if self.status.value < 400:
-            self.success = response_body
-            self.error = None
-        else:
-            self.success = None
-            self.error = response_body
-        return {'status': self.status.phrase, 'code': self.status, 'success': self.success, 'error': self.error}
+        """Return the enveloped body as a JSON response, only the body itself is serialized"""
+        return current_app.response_class(
+            self.head + dumps(response_body) + self.tail,
+            status=self.code,
+            mimetype="application/json",
+        )
+
+
+def etagged(etag, body, headers=None, mimetype="application/json"):
+    """
+    Response with ``body`` and its strong ``etag``, or an empty 304 when the request's
+    If-None-Match already holds it; ``headers`` are sent on both.
+    """
+    response = current_app.response_class(mimetype=mimetype, headers=headers)
+    response.set_etag(etag)
+    if request.if_none_match.contains(etag):
+        response.status_code = 304
+        return response
+    response.set_data(body)
+    return response
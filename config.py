@@ -19,6 +19,22 @@ def database_config():
     return SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS
 
 
+def engine_options():
+    return {
+        "pool_size": int(os.getenv("DATABASE_POOL_SIZE", 10)),
+        "max_overflow": int(os.getenv("DATABASE_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("DATABASE_POOL_TIMEOUT", 5)),
+        "pool_recycle": int(os.getenv("DATABASE_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": os.getenv("DATABASE_POOL_PRE_PING", "true").lower() == "true",
+    }
+
+
+def replica_binds():
+    """``SQLALCHEMY_BINDS`` with the read replica, see common.database.RoutingSQLAlchemy"""
+    replica_uri = os.getenv("DATABASE_REPLICA_URI")
+    return {"replica": replica_uri} if replica_uri else None
+
+
 def jwt_blacklist_config():
     JWT_BLACKLIST_ENABLED = True
     JWT_BLACKLIST_TOKEN_CHECKS = ["access", "refresh"]
@@ -36,13 +52,80 @@ class Config:
     VERSION = version
     PROPAGATE_EXCEPTIONS = True
 
+    JWT_ACCESS_TOKEN_EXPIRES_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRES_MINUTES", 15))
+    JWT_REFRESH_TOKEN_EXPIRES_MINUTES = int(os.getenv("JWT_REFRESH_TOKEN_EXPIRES_MINUTES", 43200))
+    # RS256/ES256 sign with the keys of JWT_KEYS_DIR, see auth.keys.KeyRing
+    JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+    JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR")
+    JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")
+    # every environment checks revocation, see auth.helpers.is_token_revoked
+    JWT_BLACKLIST_ENABLED, JWT_BLACKLIST_TOKEN_CHECKS = jwt_blacklist_config()
+
+    SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS = database_config()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options()
+    SQLALCHEMY_BINDS = replica_binds()
+    # milliseconds, 0 disables it
+    SQLALCHEMY_STATEMENT_TIMEOUT = int(os.getenv("DATABASE_STATEMENT_TIMEOUT", 0))
+
+    PBKDF2_ROUNDS = int(os.getenv("PBKDF2_ROUNDS", 0)) or None
+    # pbkdf2 processes of each gunicorn worker, by default the workers share the cores
+    HASHING_POOL_SIZE = int(os.getenv("HASHING_POOL_SIZE", 0)) or max(
+        1, (os.cpu_count() or 1) // int(os.getenv("GUNICORN_WORKERS", 4))
+    )
+    HASHING_TIMEOUT = float(os.getenv("HASHING_TIMEOUT", 10))
+
+    API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", 50))
+    API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", 1000))
+    API_STREAM_BATCH_SIZE = int(os.getenv("API_STREAM_BATCH_SIZE", 1000))
+    API_BULK_CHUNK_SIZE = int(os.getenv("API_BULK_CHUNK_SIZE", 1000))
+    API_BULK_MAX_CHUNK_SIZE = int(os.getenv("API_BULK_MAX_CHUNK_SIZE", 10000))
+
+    # proxies setting X-Forwarded-For in front of the app, 0 when clients connect directly
+    PROXY_COUNT = int(os.getenv("PROXY_COUNT", 0))
+
+    # endpoint: [(scope, limit, window in seconds)], see common.ratelimit.RateLimiter
+    RATELIMITS = {
+        "auth.login": [("ip", 30, 60), ("username", 10, 300)],
+        "auth.refresh": [("ip", 60, 60)],
+        "auth.change_password": [("ip", 10, 60), ("user_id", 5, 300)],
+        "auth.introspect": [("ip", 600, 60)],
+    }
+    INTROSPECT_MAX_TOKENS = int(os.getenv("INTROSPECT_MAX_TOKENS", 100))
+
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 60))
+
+    AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 500))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 1.0))
+
+    # share of the requests profiled, see common.profiling.Profiler
+    PROFILING_SAMPLE_RATIO = float(os.getenv("PROFILING_SAMPLE_RATIO", 0.0))
+
+    REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+    REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+    REDIS_DB = int(os.getenv("REDIS_DB", 0))
+    REDIS_PREFIX_JWT_TOKEN = os.getenv("REDIS_PREFIX_JWT_TOKEN", "jwt")
+    # one pool per worker process, callers block up to REDIS_POOL_TIMEOUT seconds for a free connection
+    REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 20))
+    REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 1.0))
+    REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.5))
+    REDIS_SOCKET_CONNECT_TIMEOUT = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", 0.5))
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+    # consecutive connection errors opening the breaker, seconds before probing again
+    REDIS_BREAKER_FAILURE_THRESHOLD = int(os.getenv("REDIS_BREAKER_FAILURE_THRESHOLD", 5))
+    REDIS_BREAKER_RESET_TIMEOUT = float(os.getenv("REDIS_BREAKER_RESET_TIMEOUT", 5.0))
+    # while Redis is unreachable, tokens unknown to the local revocation snapshot are
+    # accepted ("open") or rejected ("closed")
+    REDIS_FAILURE_POLICY = os.getenv("REDIS_FAILURE_POLICY", "open")
+    # "keys": one string key per revoked token, "buckets": hashes grouped by token expiry
+    REDIS_REVOCATION_STORAGE = os.getenv("REDIS_REVOCATION_STORAGE", "keys")
+    REDIS_REVOCATION_BUCKET_SECONDS = int(os.getenv("REDIS_REVOCATION_BUCKET_SECONDS", 300))
+    REDIS_REVOCATION_BUCKET_SHARDS = int(os.getenv("REDIS_REVOCATION_BUCKET_SHARDS", 16))
+
 
 class DevelopmentConfig(Config):
 
     ENV = "development"
     JWT_SECRET_KEY = Config.SECRET_KEY
-    jwt_blacklist_config()
-    SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS = database_config()
     DEBUG = True
 
 
@@ -57,6 +140,7 @@ class TestingConfig(Config):
 class ProductionConfig(Config):
 
     ENV = "production"
+    SECRET_KEY = os.getenv("SECRET_KEY")
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
     DEBUG = False
     PROPAGATE_EXCEPTIONS = True
@@ -3,12 +3,26 @@ from flask_marshmallow import Marshmallow
 from passlib.context import CryptContext
 
 from common.apispec import APISpecExt
-from flask_sqlalchemy import SQLAlchemy
+from common.cache import ResponseCache
+from common.database import RoutingSQLAlchemy
+from common.hashing import HashingService
+from common.metrics import Metrics
+from common.profiling import Profiler
+from common.ratelimit import RateLimiter
+from models.redis_models.identity_cache import IdentityCache
+from models.redis_models.revocation_cache import RevocationCache
 
 
 apispec = APISpecExt()
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 jwt = JWTManager()
+limiter = RateLimiter()
 ma = Marshmallow()
+metrics = Metrics()
+profiler = Profiler()
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+hasher = HashingService(pwd_context)
+response_cache = ResponseCache()
+revocation_cache = RevocationCache()
+identity_cache = IdentityCache(revocation_cache)
 
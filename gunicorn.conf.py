@@ -0,0 +1,33 @@
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", 4))
+# build the app once in the master, workers share its memory copy-on-write
+preload_app = True
+
+
+def post_fork(server, worker):
+    # connections opened by the master while booting must not be shared with the workers,
+    # the Redis pool, hashing pool and revocation cache already rebuild themselves
+    from extension import db
+
+    app = worker.app.wsgi()
+    with app.app_context():
+        db.engine.dispose()
+
+
+def worker_exit(server, worker):
+    # write the audit events still queued before the worker goes away
+    from auth.audit import audit_log
+
+    audit_log.drain()
+
+
+def child_exit(server, worker):
+    # the samples of a dead worker stay in PROMETHEUS_MULTIPROC_DIR, its gauges must not
+    from common.metrics import multiprocess_dir, prometheus_client
+
+    if prometheus_client is not None and multiprocess_dir():
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,20 @@
+import datetime
+
+from extension import db
+
+
+class AuditEvent(db.Model):
+    """Authentication event, written in batches by ``auth.audit.AuditLog``
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    event = db.Column(db.String(32), nullable=False)
+    success = db.Column(db.Boolean, nullable=False)
+    user_id = db.Column(db.Integer, index=True)
+    username = db.Column(db.String(80))
+    ip = db.Column(db.String(45))
+    detail = db.Column(db.String(255))
+    created_on = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return "<AuditEvent %s %s>" % (self.event, self.id)
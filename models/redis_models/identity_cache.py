@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import redis
+
+from models.redis_models.redis_model import connect_with_redis, get_redis_key_identity
+
+
+CachedUser = namedtuple("CachedUser", ["id", "username", "active"])
+
+
+class IdentityCache(object):
+    """Read-through cache of the user fields needed to authorize a request.
+
+    Lookups go to an in-process LRU first, then to a Redis hash shared by all workers, and
+    only then to the function registered with ``loader``. Entries live
+    ``IDENTITY_CACHE_TTL`` seconds locally and ``IDENTITY_CACHE_REDIS_TTL`` in Redis;
+    ``invalidate`` drops both tiers and tells the other workers to drop theirs through the
+    revocation cache channel.
+    """
+
+    def __init__(self, revocation_cache, app=None):
+        self.revocation_cache = revocation_cache
+        self.app = None
+        self._load = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("IDENTITY_CACHE_ENABLED", True)
+        app.config.setdefault("IDENTITY_CACHE_SIZE", 10000)
+        app.config.setdefault("IDENTITY_CACHE_TTL", 60)
+        app.config.setdefault("IDENTITY_CACHE_REDIS_TTL", 300)
+        self.app = app
+        self.revocation_cache.subscribe("identity", self._on_invalidate)
+
+    def loader(self, callback):
+        """Register the function loading a user by id from the database"""
+        self._load = callback
+        return callback
+
+    def get(self, user_id):
+        """Return the ``CachedUser`` for ``user_id``, or None if there is no such user"""
+        if not self.app.config["IDENTITY_CACHE_ENABLED"]:
+            return self._from_model(self._load(user_id))
+
+        user_id = int(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        key = get_redis_key_identity(user_id)
+        user = None
+        try:
+            fields = connect_with_redis().hgetall(key)
+            if fields:
+                user = CachedUser(
+                    id=int(fields["id"]),
+                    username=fields["username"],
+                    active=fields["active"] == "1",
+                )
+        except redis.RedisError as e:
+            self.app.logger.warning(f"identity cache unavailable: {str(e)}")
+
+        if user is None:
+            user = self._from_model(self._load(user_id))
+            if user is None:
+                return None
+            self._store_shared(key, user)
+
+        with self._lock:
+            self._entries[user_id] = (now + self.app.config["IDENTITY_CACHE_TTL"], user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.app.config["IDENTITY_CACHE_SIZE"]:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        user_id = int(user_id)
+        self._drop_local(user_id)
+        try:
+            connect_with_redis().delete(get_redis_key_identity(user_id))
+            self.revocation_cache.broadcast({"type": "identity", "user_id": user_id})
+        except redis.RedisError as e:
+            # the other tiers expire after IDENTITY_CACHE_REDIS_TTL and IDENTITY_CACHE_TTL
+            self.app.logger.warning(f"identity of user {user_id} not invalidated: {str(e)}")
+
+    def _store_shared(self, key, user):
+        try:
+            pipe = connect_with_redis().pipeline()
+            pipe.hset(
+                key,
+                mapping={
+                    "id": user.id,
+                    "username": user.username,
+                    "active": "1" if user.active else "0",
+                },
+            )
+            pipe.expire(key, self.app.config["IDENTITY_CACHE_REDIS_TTL"])
+            pipe.execute()
+        except redis.RedisError as e:
+            self.app.logger.warning(f"identity cache unavailable: {str(e)}")
+
+    def _drop_local(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def _on_invalidate(self, message):
+        self._drop_local(int(message["user_id"]))
+
+    @staticmethod
+    def _from_model(user):
+        if user is None:
+            return None
+        # a user created before the column had a default is active
+        return CachedUser(id=user.id, username=user.username, active=user.active is not False)
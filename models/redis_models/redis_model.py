@@ -1,30 +1,307 @@
-from datetime import timedelta
+import os
+import threading
+import time
+import zlib
 from flask import current_app as app
 
 import redis
 
 
+_pool_lock = threading.Lock()
+_pool = None
+_client = None
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """Blocking connection pool which keeps counters about its size and about the
+    time callers spent waiting for a connection.
+
+    ``redis.BlockingConnectionPool`` already resets itself when it notices it is
+    used from a forked child, the counters are reset along with it.
+    """
+
+    def reset(self):
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        super(InstrumentedConnectionPool, self).reset()
+
+    def get_connection(self, command_name, *keys, **options):
+        started = time.perf_counter()
+        connection = super(InstrumentedConnectionPool, self).get_connection(
+            command_name, *keys, **options
+        )
+        waited = time.perf_counter() - started
+        self.checkouts += 1
+        self.wait_seconds += waited
+        if waited > self.max_wait_seconds:
+            self.max_wait_seconds = waited
+        return connection
+
+    def stats(self):
+        idle = sum(1 for connection in list(self.pool.queue) if connection is not None)
+        size = len(self._connections)
+        return {
+            "max_connections": self.max_connections,
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "checkouts": self.checkouts,
+            "wait_seconds_total": self.wait_seconds,
+            "wait_seconds_max": self.max_wait_seconds,
+        }
+
+
+class CircuitOpenError(redis.ConnectionError):
+    """Raised instead of calling Redis while the circuit breaker is open"""
+
+
+class CircuitBreaker(object):
+    """Stops calling Redis after ``failure_threshold`` consecutive connection errors.
+
+    While open every call fails at once with ``CircuitOpenError``, a ``ConnectionError``,
+    so the callers' existing error handling applies without waiting for timeouts. After
+    ``reset_timeout`` seconds a single call is let through as a probe: its success closes
+    the breaker, its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=5.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.stats = {"opened": 0, "rejected": 0}
+        self._lock = threading.Lock()
+        self._probing = False
+
+    def call(self, func, *args, **kwargs):
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except CircuitOpenError:
+            raise
+        except (redis.ConnectionError, redis.TimeoutError):
+            self.record_failure()
+            raise
+        except Exception:
+            # Redis answered, with an error about the command: it is up
+            self.record_success()
+            raise
+        self.record_success()
+        return result
+
+    def before_call(self):
+        if self.state == self.CLOSED:
+            return
+        with self._lock:
+            if self.state == self.OPEN and (
+                time.monotonic() - self.opened_at >= self.reset_timeout
+            ):
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            if self.state == self.CLOSED:
+                return
+            self.stats["rejected"] += 1
+        raise CircuitOpenError("Redis circuit breaker is open")
+
+    def record_success(self):
+        if self.state == self.CLOSED and not self.failures:
+            return
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.stats["opened"] += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+class BreakerPipeline(redis.client.Pipeline):
+    breaker = None
+
+    def execute(self, raise_on_error=True):
+        if not self.command_stack:
+            return []
+        return self.breaker.call(
+            super(BreakerPipeline, self).execute, raise_on_error
+        )
+
+
+class BreakerRedis(redis.Redis):
+    """Client whose commands and pipelines all go through a ``CircuitBreaker``"""
+
+    def __init__(self, breaker, **kwargs):
+        super(BreakerRedis, self).__init__(**kwargs)
+        self.breaker = breaker
+
+    def execute_command(self, *args, **options):
+        return self.breaker.call(
+            super(BreakerRedis, self).execute_command, *args, **options
+        )
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = BreakerPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+        pipe.breaker = self.breaker
+        return pipe
+
+
+def _reset_redis_pool():
+    global _pool_lock, _pool, _client
+    _pool_lock = threading.Lock()
+    _pool = None
+    _client = None
+
+
+# sockets must never be shared between a gunicorn master and its workers
+os.register_at_fork(after_in_child=_reset_redis_pool)
+
+
+def get_redis_pool():
+    """
+    Return the connection pool of the current process, creating it on first use from the
+    ``REDIS_*`` settings of the current application.
+    """
+    global _pool, _client
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = InstrumentedConnectionPool(
+                    host=app.config["REDIS_HOST"],
+                    port=app.config["REDIS_PORT"],
+                    db=app.config["REDIS_DB"],
+                    max_connections=app.config["REDIS_MAX_CONNECTIONS"],
+                    timeout=app.config["REDIS_POOL_TIMEOUT"],
+                    socket_timeout=app.config["REDIS_SOCKET_TIMEOUT"],
+                    socket_connect_timeout=app.config["REDIS_SOCKET_CONNECT_TIMEOUT"],
+                    health_check_interval=app.config["REDIS_HEALTH_CHECK_INTERVAL"],
+                    decode_responses=True,
+                )
+                breaker = CircuitBreaker(
+                    failure_threshold=app.config["REDIS_BREAKER_FAILURE_THRESHOLD"],
+                    reset_timeout=app.config["REDIS_BREAKER_RESET_TIMEOUT"],
+                )
+                # publish the client before the pool, ``connect_with_redis`` reads it unlocked
+                _client = BreakerRedis(breaker, connection_pool=pool)
+                _pool = pool
+    return _pool
+
+
+def set_redis_pool(pool):
+    """
+    Use ``pool`` in the current process instead of one built from the settings, e.g. a
+    pool of ``fakeredis`` connections for benchmarks.
+    """
+    global _pool, _client
+    with _pool_lock:
+        _client = BreakerRedis(CircuitBreaker(), connection_pool=pool)
+        _pool = pool
+
+
+def redis_pool_stats():
+    """Counters of the connection pool of the current process, empty if not created yet"""
+    pool = _pool
+    if pool is None:
+        return {}
+    return pool.stats()
+
+
+def redis_breaker_state():
+    """State of the circuit breaker of the current process, closed if not created yet"""
+    client = _client
+    if client is None:
+        return CircuitBreaker.CLOSED
+    return client.breaker.state
+
+
 def get_redix_prefix_jwt_token():
     return app.config["REDIS_PREFIX_JWT_TOKEN"] + ":"
 
 
+def get_redis_key_revoked_before():
+    """Hash holding, per user id, the time before which all of the user's tokens are revoked"""
+    return app.config["REDIS_PREFIX_JWT_TOKEN"] + "_revoked_before"
+
+
+def get_redis_key_identity(user_id):
+    """Hash caching the authorization fields of a user, see ``IdentityCache``"""
+    return app.config["REDIS_PREFIX_JWT_TOKEN"] + f"_user:{user_id}"
+
+
+def get_redis_prefix_revocation_bucket():
+    return app.config["REDIS_PREFIX_JWT_TOKEN"] + "_bucket:"
+
+
+def get_revocation_bucket_key(token_jti, expires):
+    """
+    Hash holding the revocation of ``token_jti`` in the "buckets" storage. Tokens expiring in
+    the same ``REDIS_REVOCATION_BUCKET_SECONDS`` window share a bucket, spread over
+    ``REDIS_REVOCATION_BUCKET_SHARDS`` hashes so each one stays small enough for Redis to
+    keep it in its compact encoding.
+    """
+    window = int(expires) // app.config["REDIS_REVOCATION_BUCKET_SECONDS"]
+    shard = zlib.crc32(token_jti.encode()) % app.config["REDIS_REVOCATION_BUCKET_SHARDS"]
+    return f"{get_redis_prefix_revocation_bucket()}{window}:{shard}"
+
+
 def connect_with_redis():
-    return redis.Redis(
-        host=app.config["REDIS_HOST"],
-        port=app.config["REDIS_PORT"],
-        db=0,
-        decode_responses=True,
-    )
+    """
+    Return the shared client of the current process. Connections are borrowed from the
+    process wide pool for each command, so this is cheap to call on every request.
+    """
+    client = _client
+    if client is None:
+        get_redis_pool()
+        client = _client
+    return client
 
 
 class RedisModel(object):
+    """Base of the models cached in Redis, each instance is stored as a hash.
+
+    Subclasses name the model and map its fields to the function converting them back
+    from the strings Redis returns:
+
+        class DemoCache(RedisModel):
+            model_name = "demo"
+            fields = {"demo_id": int, "name": str}
+
+    Ids are allocated with ``INCR`` on ``latest_instance_id_key`` so concurrent writers
+    never get the same one. ``None`` values are not stored.
+    """
+
+    model_name = None
+    fields = {}
+
+    def __init__(self, id=None, **kwargs):
+        self.id = id
+        for field in self.fields:
+            setattr(self, field, kwargs.get(field))
+
     @classmethod
     def latest_instance_id_key(cls):
         """
-        'key' to track id of latest instance of model 'demo'. Redis has no counter therefore we need to track id for
-        own self.
+        'key' of the counter holding the id of the latest instance of the model.
+
+        Example:
+        Consider model 'demo', this method will return 'latest_demo_id'
         """
-        pass
+        return f"latest_{cls.model_name}_id"
 
     @classmethod
     def list_key(cls):
@@ -34,65 +311,158 @@ class RedisModel(object):
         Example:
         Consider model 'demo', this method will return 'demos'
         """
-        pass
+        return f"{cls.model_name}s"
 
-    def add_to_list(self):
+    def add_to_list(self, pipe=None):
         """
         Consider model 'demo', this method will add 'demo.id' to 'demos'
         """
-        pass
+        (pipe or connect_with_redis()).rpush(self.list_key(), self.id)
 
     @classmethod
     def latest_instance_id(cls):
         """
-        This will use 'latest_instance_id_key' and will return the value stored at this key.
-        latest_instance-id will give the value of latest_instance_id_keys.
+        This will use 'latest_instance_id_key' and will return the value stored at this key,
+        0 if no instance was ever saved.
         """
-        pass
+        return int(connect_with_redis().get(cls.latest_instance_id_key()) or 0)
 
-    def increment_latest_instance_id(self):
+    @classmethod
+    def increment_latest_instance_id(cls, amount=1):
         """
-        Once an instance is added to redis, increase counter by 1.
+        Atomically reserve ``amount`` ids, returns the last of them.
         """
-        pass
+        return connect_with_redis().incrby(cls.latest_instance_id_key(), amount)
 
     @classmethod
-    def cache_key(cls):
+    def cache_key(cls, instance_id):
         """
-        This generates a 'key' for a new instance being added.
+        This generates the 'key' of an instance.
 
         Example:
-        Consider model 'demo'. if 5 instances of demo are already in Redis and a new instance is being added, then this
-        would return 'demo-6'.
+        Consider model 'demo', the instance with id 6 is stored at 'demo-6'.
         """
-        pass
+        return f"{cls.model_name}-{instance_id}"
+
+    def to_mapping(self):
+        mapping = {"id": self.id}
+        for field in self.fields:
+            value = getattr(self, field)
+            if value is not None:
+                mapping[field] = value
+        return mapping
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        return cls(
+            id=int(mapping["id"]),
+            **{
+                field: convert(mapping[field])
+                for field, convert in cls.fields.items()
+                if field in mapping
+            },
+        )
 
     def save(self):
         """
-        This inserts a new instance to redis.
+        This inserts a new instance to redis, or overwrites it if it already has an id.
+        """
+        self.save_many([self])
+        return self
+
+    @classmethod
+    def save_many(cls, instances, batch_size=500):
+        """
+        Save instances by batches: the ids of the new ones are reserved with a single
+        ``INCRBY``, then hashes and list entries of the batch are written in one MULTI.
+        """
+        instances = list(instances)
+        for start in range(0, len(instances), batch_size):
+            batch = instances[start:start + batch_size]
+            new = [instance for instance in batch if instance.id is None]
+            if new:
+                last_id = cls.increment_latest_instance_id(len(new))
+                for offset, instance in enumerate(new):
+                    instance.id = last_id - len(new) + 1 + offset
+
+            pipe = connect_with_redis().pipeline(transaction=True)
+            for instance in batch:
+                pipe.hset(cls.cache_key(instance.id), mapping=instance.to_mapping())
+            for instance in new:
+                instance.add_to_list(pipe)
+            pipe.execute()
+        return instances
+
+    @classmethod
+    def get(cls, instance_id):
+        return cls.get_many([instance_id])[0]
+
+    @classmethod
+    def get_many(cls, instance_ids, batch_size=500):
+        """
+        Fetch instances by batches of one pipelined round trip, ``None`` for missing ids.
         """
-        pass
+        instance_ids = list(instance_ids)
+        instances = []
+        for start in range(0, len(instance_ids), batch_size):
+            pipe = connect_with_redis().pipeline(transaction=False)
+            for instance_id in instance_ids[start:start + batch_size]:
+                pipe.hgetall(cls.cache_key(instance_id))
+            instances.extend(
+                cls.from_mapping(mapping) if mapping else None for mapping in pipe.execute()
+            )
+        return instances
+
+    @classmethod
+    def all_ids(cls):
+        instance_ids = connect_with_redis().lrange(cls.list_key(), 0, -1)
+        return [int(instance_id) for instance_id in instance_ids]
 
-    def set_logout_key(self, token_jti, token_name):
+    def set_logout_key(self, token_jti, token_name, expires):
+        """
+        Revoke a single token until ``expires``, its ``exp`` claim, which also decides the
+        bucket the token is looked up in.
+        """
         app.logger.info(
             f"entered: set logout key with token: {token_jti} and token_name: {token_name}"
         )
-        connection = connect_with_redis()
-        app.logger.info(connection)
-        if token_name == "access":
-            connection.set(
-                token_jti,
-                1,
-                timedelta(
-                    minutes=app.config["JWT_ACCESS_TOKEN_EXPIRES_MINUTES"]
-                ),
-            )
-        elif token_name == "refresh":
-            connection.set(
-                token_jti,
-                1,
-                timedelta(
-                    minutes=app.config["JWT_REFRESH_TOKEN_EXPIRES_MINUTES"]
-                ),
-            )
+        self.revoke_many([(token_jti, expires)])
         app.logger.info("exit: set logout key")
+
+    def revoke_many(self, tokens):
+        """
+        Revoke ``(token_jti, expires)`` pairs in a single pipelined round trip. Each
+        revocation lives exactly as long as its token.
+        """
+        pipe = connect_with_redis().pipeline(transaction=False)
+        for token_jti, expires in tokens:
+            self.queue_revoke(pipe, token_jti, expires)
+        pipe.execute()
+
+    @classmethod
+    def queue_revoke(cls, pipe, token_jti, expires):
+        expires = int(expires)
+        if app.config["REDIS_REVOCATION_STORAGE"] == "buckets":
+            bucket = get_revocation_bucket_key(token_jti, expires)
+            window = app.config["REDIS_REVOCATION_BUCKET_SECONDS"]
+            pipe.hset(bucket, token_jti, expires)
+            # the whole bucket goes once the last token it can hold has expired
+            pipe.expireat(bucket, (expires // window + 1) * window)
+        else:
+            ttl = max(1, int(expires - time.time()))
+            pipe.set(get_redix_prefix_jwt_token() + token_jti, expires, ex=ttl)
+
+    @classmethod
+    def queue_is_revoked(cls, pipe, token_jti, expires):
+        """Queue the command answering whether the token is revoked, truthy if it is"""
+        if app.config["REDIS_REVOCATION_STORAGE"] == "buckets":
+            pipe.hexists(get_revocation_bucket_key(token_jti, expires), token_jti)
+        else:
+            pipe.exists(get_redix_prefix_jwt_token() + token_jti)
+
+    def set_revoked_before(self, user_id, revoked_before):
+        app.logger.info(
+            f"entered: set revoked before for user: {user_id} at: {revoked_before}"
+        )
+        connect_with_redis().hset(get_redis_key_revoked_before(), user_id, revoked_before)
+        app.logger.info("exit: set revoked before")
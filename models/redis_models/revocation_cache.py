@@ -0,0 +1,218 @@
+import json
+import threading
+import time
+
+import redis
+
+from common.process import PerProcess
+from models.redis_models.redis_model import (
+    connect_with_redis,
+    get_redis_key_revoked_before,
+    get_redis_prefix_revocation_bucket,
+    get_redix_prefix_jwt_token,
+)
+
+
+class RevocationCache(object):
+    """In-process copy of the revoked token ids, kept in sync through Redis pub/sub.
+
+    Every worker subscribes to ``REVOCATION_CHANNEL`` and loads the revoked ids already
+    stored in Redis. Once both are done the cache is authoritative: a token id that is not
+    in the local set has not been revoked and the blacklist check needs no network call.
+    Entries are dropped once the token they belong to has expired. The per user
+    "revoked before" watermarks are replicated the same way.
+
+    While the cache is not authoritative (still loading, subscriber disconnected, or more
+    than ``REVOCATION_CACHE_MAX_ENTRIES`` revoked tokens) ``lookup`` returns ``None`` and
+    callers must ask Redis.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._revoked = {}
+        self._revoked_before = {}
+        self._warm = False
+        self._overflow = False
+        self._process = PerProcess(self._start_listener)
+        self._subscribers = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("REVOCATION_CACHE_ENABLED", True)
+        app.config.setdefault("REVOCATION_CACHE_MAX_ENTRIES", 100000)
+        app.config.setdefault("REVOCATION_CHANNEL", "jwt:revocations")
+        app.config.setdefault("REVOCATION_CACHE_PURGE_INTERVAL", 60)
+        app.config.setdefault("REVOCATION_CACHE_RETRY_INTERVAL", 1.0)
+        self.app = app
+
+    def lookup(self, jti):
+        """
+        Return True if the token id is known to be revoked, False if it is known not to be,
+        and None if the cache cannot answer.
+        """
+        if not self.app.config["REVOCATION_CACHE_ENABLED"]:
+            return None
+        self._process.ensure()
+        if jti in self._revoked:
+            return True
+        if self._warm and not self._overflow:
+            return False
+        return None
+
+    def lookup_revoked_before(self, user_id):
+        """
+        Return the watermark of the user (0 if none was ever set), or None if the cache
+        cannot answer.
+        """
+        if not self.app.config["REVOCATION_CACHE_ENABLED"]:
+            return None
+        self._process.ensure()
+        if self._warm:
+            return self._revoked_before.get(str(user_id), 0)
+        return None
+
+    def is_revoked_locally(self, jti, user_id, issued_at):
+        """
+        Answer from what this worker has replicated so far, even when the cache is not
+        authoritative: used while Redis is unreachable.
+        """
+        revoked_before = self._revoked_before.get(str(user_id), 0)
+        return jti in self._revoked or issued_at < revoked_before
+
+    def add(self, jti, expires):
+        with self._lock:
+            if jti in self._revoked:
+                return
+            if len(self._revoked) >= self.app.config["REVOCATION_CACHE_MAX_ENTRIES"]:
+                self._overflow = True
+                return
+            self._revoked[jti] = expires
+
+    def set_revoked_before(self, user_id, revoked_before):
+        user_id = str(user_id)
+        with self._lock:
+            if revoked_before > self._revoked_before.get(user_id, 0):
+                self._revoked_before[user_id] = revoked_before
+
+    def publish(self, jti, expires):
+        """Store the revocation locally and broadcast it to the other workers"""
+        self.add(jti, expires)
+        self.broadcast({"type": "jti", "jti": jti, "exp": expires})
+
+    def publish_many(self, tokens):
+        """Same as ``publish`` for a list of ``(jti, expires)`` pairs"""
+        for jti, expires in tokens:
+            self.add(jti, expires)
+        self.broadcast({"type": "jtis", "tokens": tokens})
+
+    def publish_revoked_before(self, user_id, revoked_before):
+        """Store the watermark locally and broadcast it to the other workers"""
+        self.set_revoked_before(user_id, revoked_before)
+        self.broadcast(
+            {"type": "user", "user_id": str(user_id), "revoked_before": revoked_before}
+        )
+
+    def subscribe(self, message_type, callback):
+        """
+        Call ``callback(message)`` for the messages of ``message_type`` broadcast by any
+        worker, to share the subscriber connection with other in-process caches.
+        """
+        self._subscribers[message_type] = callback
+
+    def broadcast(self, message):
+        connect_with_redis().publish(
+            self.app.config["REVOCATION_CHANNEL"], json.dumps(message)
+        )
+
+    def purge(self):
+        now = time.time()
+        with self._lock:
+            self._revoked = {
+                jti: expires for jti, expires in self._revoked.items() if expires > now
+            }
+
+    def _start_listener(self):
+        self._warm = False
+        thread = threading.Thread(target=self._listen, name="revocation-cache", daemon=True)
+        thread.start()
+
+    def _listen(self):
+        retry_interval = self.app.config["REVOCATION_CACHE_RETRY_INTERVAL"]
+        purge_interval = self.app.config["REVOCATION_CACHE_PURGE_INTERVAL"]
+        while True:
+            pubsub = None
+            try:
+                with self.app.app_context():
+                    client = connect_with_redis()
+                    prefix = get_redix_prefix_jwt_token()
+                    bucket_prefix = get_redis_prefix_revocation_bucket()
+                    revoked_before_key = get_redis_key_revoked_before()
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.app.config["REVOCATION_CHANNEL"])
+                # subscribe first so nothing revoked while loading is missed
+                self._load(client, prefix, bucket_prefix)
+                for user_id, revoked_before in client.hgetall(revoked_before_key).items():
+                    self.set_revoked_before(user_id, float(revoked_before))
+                self._warm = True
+                purged_at = time.monotonic()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        self._handle(json.loads(message["data"]))
+                    if time.monotonic() - purged_at > purge_interval:
+                        self.purge()
+                        purged_at = time.monotonic()
+                        if self._overflow:
+                            self._overflow = False
+                            self._load(client, prefix, bucket_prefix)
+            except (redis.RedisError, ValueError) as e:
+                self._warm = False
+                self.app.logger.warning(f"revocation cache listener failed: {str(e)}")
+                time.sleep(retry_interval)
+            finally:
+                if pubsub is not None:
+                    pubsub.close()
+
+    def _handle(self, message):
+        if message.get("type") == "jti":
+            self.add(message["jti"], message["exp"])
+        elif message.get("type") == "jtis":
+            for jti, expires in message["tokens"]:
+                self.add(jti, expires)
+        elif message.get("type") == "user":
+            self.set_revoked_before(message["user_id"], message["revoked_before"])
+        elif message.get("type") in self._subscribers:
+            self._subscribers[message["type"]](message)
+
+    def _load(self, client, prefix, bucket_prefix):
+        # both storage layouts are loaded, so switching REDIS_REVOCATION_STORAGE loses nothing
+        for keys in self._scan(client, prefix + "*"):
+            now = time.time()
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.ttl(key)
+            for key, ttl in zip(keys, pipe.execute()):
+                if ttl is not None and ttl > 0:
+                    self.add(key[len(prefix):], now + ttl)
+
+        for keys in self._scan(client, bucket_prefix + "*"):
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+            for bucket in pipe.execute():
+                for jti, expires in bucket.items():
+                    self.add(jti, int(expires))
+
+    @staticmethod
+    def _scan(client, match, count=1000):
+        keys = []
+        for key in client.scan_iter(match=match, count=count):
+            keys.append(key)
+            if len(keys) == count:
+                yield keys
+                keys = []
+        if keys:
+            yield keys
@@ -1,4 +1,7 @@
-from extension import db, pwd_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+from extension import db, hasher, identity_cache
 
 
 class User(db.Model):
@@ -13,7 +16,27 @@ class User(db.Model):
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
-        self.password = pwd_context.hash(self.password)
+        self.password = hasher.hash(self.password)
 
     def __repr__(self):
         return "<User %s>" % self.username
+
+
+@event.listens_for(User, "after_update")
+def track_identity_change(mapper, connection, target):
+    """Remember users whose cached authorization fields changed, e.g. on deactivation"""
+    attrs = inspect(target).attrs
+    if attrs.active.history.has_changes() or attrs.username.history.has_changes():
+        object_session(target).info.setdefault("identity_changed", set()).add(target.id)
+
+
+@event.listens_for(db.session, "after_commit")
+def invalidate_changed_identities(session):
+    # only once committed, or another request could cache the old row again
+    for user_id in session.info.pop("identity_changed", ()):
+        identity_cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, "after_rollback")
+def forget_changed_identities(session):
+    session.info.pop("identity_changed", None)
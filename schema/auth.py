@@ -0,0 +1,51 @@
+from flask import current_app
+from marshmallow import EXCLUDE, ValidationError, validate, validates, validates_schema
+
+from extension import ma
+
+
+class LoginSchema(ma.Schema):
+
+    username = ma.String(required=True, validate=validate.Length(min=1), example="admin")
+    password = ma.String(required=True, validate=validate.Length(min=1), example="admin")
+
+    class Meta:
+        # login always ignored the fields it does not use
+        unknown = EXCLUDE
+
+
+class ChangePasswordSchema(ma.Schema):
+
+    user_id = ma.Int(required=True)
+    current_password = ma.String(required=True)
+    new_password = ma.String(required=True)
+    confirm_password = ma.String(required=True)
+
+    @validates_schema
+    def check_confirm_password(self, data, **kwargs):
+        if data["new_password"] != data["confirm_password"]:
+            raise ValidationError("password does not match", "confirm_password")
+
+
+class ResetPasswordSchema(ma.Schema):
+
+    username = ma.String(required=True)
+    password = ma.String(required=True)
+
+
+class IntrospectSchema(ma.Schema):
+
+    tokens = ma.List(ma.String(), required=True)
+
+    @validates("tokens")
+    def check_token_count(self, tokens, **kwargs):
+        limit = current_app.config["INTROSPECT_MAX_TOKENS"]
+        if not 1 <= len(tokens) <= limit:
+            raise ValidationError(f"between 1 and {limit} tokens per call")
+
+
+# schemas are stateless once built, the views share these instances
+login_schema = LoginSchema()
+change_password_schema = ChangePasswordSchema()
+reset_password_schema = ResetPasswordSchema()
+introspect_schema = IntrospectSchema()
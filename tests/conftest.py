@@ -0,0 +1,54 @@
+import os
+import uuid
+
+import fakeredis
+import pytest
+
+# read when config is imported
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import create_app
+    from extension import db
+    from models.redis_models.redis_model import InstrumentedConnectionPool, set_redis_pool
+
+    set_redis_pool(
+        InstrumentedConnectionPool(
+            connection_class=fakeredis.FakeConnection,
+            server=fakeredis.FakeServer(),
+            decode_responses=True,
+        )
+    )
+    app = create_app("development")
+    app.config.update(
+        HASHING_POOL_ENABLED=False, AUDIT_ENABLED=False, RATELIMIT_ENABLED=False
+    )
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    """``(username, password)`` of a new user, the caches are shared by the tests"""
+    from extension import db
+    from models.user import User
+
+    username = f"user-{uuid.uuid4().hex[:12]}"
+    with app.app_context():
+        db.session.add(User(username=username, email=f"{username}@example.com", password="pw"))
+        db.session.commit()
+    return username, "pw"
+
+
+def login(client, username, password):
+    response = client.post("/auth/login", json={"username": username, "password": password})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["success"]["data"]
@@ -0,0 +1,37 @@
+import time
+
+from auth.audit import audit_log
+from models.audit_event import AuditEvent
+
+
+def count(event):
+    return AuditEvent.query.filter_by(event=event).count()
+
+
+def test_drain_writes_the_batch_held_by_the_flusher(app):
+    app.config.update(AUDIT_ENABLED=True, AUDIT_FLUSH_INTERVAL=30)
+    try:
+        with app.app_context():
+            for i in range(5):
+                audit_log.record("test_drain", username=f"user{i}")
+            # the flusher picks the events up and waits for more
+            time.sleep(0.2)
+            audit_log.drain()
+            assert count("test_drain") == 5
+    finally:
+        app.config.update(AUDIT_ENABLED=False, AUDIT_FLUSH_INTERVAL=1.0)
+        audit_log._process.pid = None
+
+
+def test_long_values_are_cut_to_the_columns(app):
+    app.config.update(AUDIT_ENABLED=True, AUDIT_FLUSH_INTERVAL=30)
+    try:
+        with app.app_context():
+            audit_log.record("test_long", username="u" * 500, detail="d" * 1000)
+            audit_log.drain()
+            event = AuditEvent.query.filter_by(event="test_long").one()
+            assert len(event.username) == 80
+            assert len(event.detail) == 255
+    finally:
+        app.config.update(AUDIT_ENABLED=False, AUDIT_FLUSH_INTERVAL=1.0)
+        audit_log._process.pid = None
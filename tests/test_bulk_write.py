@@ -0,0 +1,55 @@
+import pytest
+
+from extension import db
+from models.demo import Demo
+
+
+@pytest.fixture
+def demos(app):
+    with app.app_context():
+        Demo.query.delete()
+        db.session.commit()
+
+    def stored():
+        with app.app_context():
+            return [demo.demo_id for demo in Demo.query.order_by(Demo.demo_id)]
+
+    return stored
+
+
+def test_rows_with_different_keys(client, demos):
+    reply = client.post("/api/v1/demos", json=[{}, {"demo_id": 500}, {}])
+    assert reply.status_code == 201
+    assert reply.get_json()["written"] == 3
+    assert 500 in demos()
+    assert len(demos()) == 3
+
+
+def test_duplicate_rows_are_reported(client, demos):
+    reply = client.post("/api/v1/demos", json=[{}, {"demo_id": 500}, {"demo_id": 500}])
+    assert reply.status_code == 207
+    body = reply.get_json()
+    assert body["written"] == 2
+    assert list(body["errors"]) == ["2"]
+    assert demos().count(500) == 1
+
+
+def test_invalid_rows_are_reported(client, demos):
+    reply = client.post("/api/v1/demos", json=[{"demo_id": "abc"}, {"demo_id": 7}])
+    assert reply.status_code == 207
+    body = reply.get_json()
+    assert body["written"] == 1
+    assert list(body["errors"]) == ["0"]
+    assert demos() == [7]
+
+
+def test_upsert_keeps_explicit_ids(client, demos):
+    reply = client.post("/api/v1/demos?mode=upsert", json=[{}, {"demo_id": 42}, {"demo_id": 42}])
+    assert reply.status_code == 201
+    assert demos().count(42) == 1
+
+
+def test_nothing_written(client, demos):
+    reply = client.post("/api/v1/demos", json=[{"demo_id": "abc"}])
+    assert reply.status_code == 400
+    assert demos() == []
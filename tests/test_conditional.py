@@ -0,0 +1,34 @@
+import pytest
+
+
+@pytest.fixture
+def swagger_url(app):
+    return (app.config["SWAGGER_URL_PREFIX"] or "") + app.config["SWAGGER_JSON_URL"]
+
+
+def revalidate(client, url, **headers):
+    first = client.get(url, headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    second = client.get(url, headers={"If-None-Match": etag, **headers})
+    assert second.status_code == 304
+    assert second.data == b""
+    return first, second
+
+
+def test_openapi_document(client, swagger_url):
+    first, second = revalidate(client, swagger_url, **{"Accept-Encoding": "gzip"})
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in second.headers
+    assert second.headers["Vary"] == "Accept-Encoding"
+    assert second.headers["Cache-Control"] == first.headers["Cache-Control"]
+
+
+def test_jwks(client):
+    first, second = revalidate(client, "/.well-known/jwks.json")
+    assert first.get_json() == {"keys": []}
+    assert "max-age" in second.headers["Cache-Control"]
+
+
+def test_cached_response(client):
+    revalidate(client, "/api/v1/demos")
@@ -0,0 +1,86 @@
+import os
+import signal
+import time
+
+import pytest
+from flask import Flask
+from passlib.context import CryptContext
+
+from common.hashing import HashingBusy, HashingService
+
+
+@pytest.fixture
+def hashing():
+    app = Flask(__name__)
+    app.config.update(HASHING_POOL_SIZE=1, HASHING_QUEUE_DEPTH=1, PBKDF2_ROUNDS=1000)
+    service = HashingService(CryptContext(schemes=["pbkdf2_sha256"]), app)
+    with app.app_context():
+        yield service
+    if service._executor is not None:
+        service._executor.shutdown(wait=True)
+
+
+def wait_for_free_slots(service, slots):
+    deadline = time.monotonic() + 10
+    while service._slots._value != slots and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert service._slots._value == slots
+
+
+def test_runs_on_the_pool(hashing):
+    hashed = hashing.hash("secret")
+    assert hashing.verify("secret", hashed)
+    assert not hashing.verify("other", hashed)
+    assert hashing._executor is not None
+    assert hashing.stats["calls"] == 3
+
+
+def test_timed_out_calls_keep_their_slot(hashing):
+    hashing.app.config["HASHING_TIMEOUT"] = 0.0001
+    # the first call also starts the pool process, it can not answer in time
+    with pytest.raises(HashingBusy):
+        hashing.hash("secret")
+    # the timed out call still occupies the single slot
+    with pytest.raises(HashingBusy):
+        hashing.hash("secret")
+    assert hashing.stats["timeouts"] == 1
+    assert hashing.stats["rejected"] == 1
+
+    wait_for_free_slots(hashing, 1)
+    hashing.app.config["HASHING_TIMEOUT"] = 10
+    assert hashing.verify("secret", hashing.hash("secret"))
+
+
+def test_pool_replaced_after_a_process_died(hashing):
+    hashing.hash("secret")
+    for pid in list(hashing._executor._processes):
+        os.kill(pid, signal.SIGKILL)
+    time.sleep(0.2)
+    try:
+        hashed = hashing.hash("secret")
+    except HashingBusy:
+        # the call in flight when the pool broke, the next one gets a new pool
+        hashed = hashing.hash("secret")
+    assert hashing.verify("secret", hashed)
+
+
+def test_saturated_pool_answers_503(app, client, user):
+    app.config.update(HASHING_POOL_ENABLED=True)
+    hasher = app.extensions["hashing"]
+    try:
+        with app.app_context():
+            hasher._process.ensure()
+        slots = hasher._slots
+        taken = 0
+        while slots.acquire(blocking=False):
+            taken += 1
+        try:
+            username, password = user
+            reply = client.post("/auth/login", json={"username": username, "password": password})
+        finally:
+            for _ in range(taken):
+                slots.release()
+        assert reply.status_code == 503
+        assert reply.headers["Retry-After"] == str(app.config["HASHING_RETRY_AFTER"])
+    finally:
+        app.config.update(HASHING_POOL_ENABLED=False)
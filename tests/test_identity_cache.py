@@ -0,0 +1,55 @@
+import pytest
+import redis
+
+from extension import db, identity_cache
+from models.redis_models import identity_cache as identity_cache_module
+from models.user import User
+from tests.conftest import login
+
+
+@pytest.fixture
+def user_id(app, user):
+    with app.app_context():
+        return User.query.filter_by(username=user[0]).one().id
+
+
+def test_lookups_are_cached(app, user_id, monkeypatch):
+    with app.app_context():
+        first = identity_cache.get(user_id)
+        loads = []
+        monkeypatch.setattr(identity_cache, "_load", lambda uid: loads.append(uid))
+        assert identity_cache.get(user_id) == first
+        assert first.active
+        assert loads == []
+        assert identity_cache.get(10 ** 9) is None
+
+
+def test_committed_changes_invalidate_the_entry(app, user_id):
+    with app.app_context():
+        identity_cache.get(user_id)
+        User.query.get(user_id).active = False
+        db.session.commit()
+        assert not identity_cache.get(user_id).active
+
+
+def test_invalidate_without_redis(app, user_id, monkeypatch):
+    def unavailable():
+        raise redis.ConnectionError("down")
+
+    with app.app_context():
+        identity_cache.get(user_id)
+        monkeypatch.setattr(identity_cache_module, "connect_with_redis", unavailable)
+        identity_cache.invalidate(user_id)
+        # the local entry is gone, the lookup falls back to the database
+        assert identity_cache.get(user_id).id == user_id
+
+
+def test_deactivated_user_is_rejected(app, client, user, user_id):
+    tokens = login(client, *user)
+    with app.app_context():
+        User.query.get(user_id).active = False
+        db.session.commit()
+    reply = client.delete(
+        "/auth/revoke_access", headers={"Authorization": f"Bearer {tokens['access_token']}"}
+    )
+    assert reply.status_code == 401
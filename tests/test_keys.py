@@ -0,0 +1,69 @@
+import pytest
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from flask import Flask
+
+from auth.keys import KeyRing
+
+
+def write_key(directory, kid, private_key, public_only=False):
+    if public_only:
+        data = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        directory.joinpath(f"{kid}.pub.pem").write_bytes(data)
+    else:
+        data = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        directory.joinpath(f"{kid}.pem").write_bytes(data)
+
+
+def rsa_key():
+    return rsa.generate_private_key(65537, 2048, default_backend())
+
+
+def ec_key():
+    return ec.generate_private_key(ec.SECP256R1(), default_backend())
+
+
+def key_ring(directory, algorithm, active_kid=None):
+    app = Flask(__name__)
+    app.config.update(
+        JWT_ALGORITHM=algorithm, JWT_KEYS_DIR=str(directory), JWT_ACTIVE_KID=active_kid
+    )
+    return KeyRing(app)
+
+
+def test_single_key_is_active(tmp_path):
+    write_key(tmp_path, "a", rsa_key())
+    assert key_ring(tmp_path, "RS256").active_kid == "a"
+
+
+def test_active_kid_required_with_several_keys(tmp_path):
+    write_key(tmp_path, "a", rsa_key())
+    write_key(tmp_path, "b", rsa_key())
+    with pytest.raises(RuntimeError, match="JWT_ACTIVE_KID"):
+        key_ring(tmp_path, "RS256")
+    assert key_ring(tmp_path, "RS256", active_kid="a").active_kid == "a"
+
+
+def test_active_key_must_fit_the_algorithm(tmp_path):
+    write_key(tmp_path, "a", ec_key())
+    with pytest.raises(RuntimeError, match="can not sign RS256"):
+        key_ring(tmp_path, "RS256")
+    assert key_ring(tmp_path, "ES256").active_kid == "a"
+    with pytest.raises(RuntimeError, match="can not sign ES384"):
+        key_ring(tmp_path, "ES384")
+
+
+def test_jwks_alg_follows_the_key_type(tmp_path):
+    write_key(tmp_path, "old", rsa_key(), public_only=True)
+    write_key(tmp_path, "new", ec_key())
+    ring = key_ring(tmp_path, "ES256")
+    reply = ring.app.test_client().get("/.well-known/jwks.json")
+    algs = {key["kid"]: key["alg"] for key in reply.get_json()["keys"]}
+    assert algs == {"old": "RS256", "new": "ES256"}
@@ -0,0 +1,16 @@
+def test_metrics_are_exported(client):
+    client.get("/api/v1/demos")
+    body = client.get("/metrics").data.decode()
+    assert 'http_requests_total{endpoint="api.demos",method="GET",status="200"}' in body
+    assert "dependency_call_duration_seconds_bucket" in body
+
+
+def test_db_pool_counters_only_grow(app):
+    metrics = app.extensions["metrics"]
+    stats = {"checkouts": 5, "wait_seconds_total": 0.5}
+    assert metrics._db_pool_increase("test", stats) == (5, 0.5)
+    stats = {"checkouts": 8, "wait_seconds_total": 0.75}
+    assert metrics._db_pool_increase("test", stats) == (3, 0.25)
+    # a request reading the stats before the previous one
+    stats = {"checkouts": 7, "wait_seconds_total": 0.7}
+    assert metrics._db_pool_increase("test", stats) == (0, 0.0)
@@ -0,0 +1,23 @@
+import os
+
+from common.process import PerProcess
+
+
+def test_setup_runs_once_per_process():
+    calls = []
+    process = PerProcess(lambda: calls.append(os.getpid()))
+    assert not process.current
+    process.ensure()
+    process.ensure()
+    assert calls == [os.getpid()]
+    assert process.current
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # the child inherits ``calls`` but must run the setup again
+        process.ensure()
+        os.write(write, b"1" if process.current and len(calls) == 2 else b"0")
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read, 1) == b"1"
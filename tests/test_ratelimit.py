@@ -0,0 +1,61 @@
+import pytest
+
+from tests.conftest import login
+
+
+@pytest.fixture
+def limits(app):
+    app.config["RATELIMIT_ENABLED"] = True
+    yield app.config["RATELIMITS"]
+    app.config["RATELIMIT_ENABLED"] = False
+
+
+def change_password(client, user_id, headers=None):
+    return client.put(
+        "/auth/change_password",
+        headers=headers or {},
+        json={
+            "user_id": user_id,
+            "current_password": "wrong",
+            "new_password": "x",
+            "confirm_password": "x",
+        },
+    )
+
+
+def test_login_limited_by_username(client, user, limits):
+    username, _ = user
+    _, limit, _ = limits["auth.login"][1]
+    codes = [
+        client.post("/auth/login", json={"username": username, "password": "wrong"}).status_code
+        for _ in range(limit + 1)
+    ]
+    assert codes[:limit] == [401] * limit
+    assert codes[limit] == 429
+
+
+def test_anonymous_requests_do_not_spend_a_user_quota(client, user, limits):
+    from flask_jwt_extended import decode_token
+
+    tokens = login(client, *user)
+    with client.application.app_context():
+        user_id = decode_token(tokens["access_token"])["identity"]["id"]
+    _, limit, _ = limits["auth.change_password"][1]
+    for _ in range(limit + 1):
+        assert change_password(client, user_id).status_code == 401
+
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert change_password(client, user_id, headers).status_code != 429
+
+
+def test_client_address_behind_a_proxy():
+    from flask import Flask, request
+
+    from app import configure_proxy
+
+    app = Flask(__name__)
+    app.config["PROXY_COUNT"] = 1
+    configure_proxy(app)
+    app.add_url_rule("/ip", "ip", lambda: request.remote_addr)
+    reply = app.test_client().get("/ip", headers={"X-Forwarded-For": "203.0.113.7"})
+    assert reply.data == b"203.0.113.7"
@@ -0,0 +1,46 @@
+import pytest
+import redis
+
+from models.redis_models.redis_model import CircuitBreaker, CircuitOpenError
+
+
+def fail(error):
+    def call():
+        raise error
+
+    return call
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(redis.ConnectionError):
+            breaker.call(fail(redis.ConnectionError("down")))
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "PONG")
+    assert breaker.stats == {"opened": 1, "rejected": 1}
+
+
+def test_probe_answered_with_an_error_closes_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    with pytest.raises(redis.ConnectionError):
+        breaker.call(fail(redis.ConnectionError("down")))
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # the probe reaches Redis, which rejects the command
+    with pytest.raises(redis.ResponseError):
+        breaker.call(fail(redis.ResponseError("WRONGTYPE")))
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert not breaker._probing
+    assert breaker.call(lambda: "PONG") == "PONG"
+
+
+def test_failed_probe_opens_again():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    with pytest.raises(redis.ConnectionError):
+        breaker.call(fail(redis.ConnectionError("down")))
+    with pytest.raises(redis.TimeoutError):
+        breaker.call(fail(redis.TimeoutError("slow")))
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker._probing
@@ -0,0 +1,26 @@
+import json
+
+from common import response
+from common.response import dumps
+from tests.conftest import login
+
+
+def test_dumps_integer_keys_sorted():
+    assert dumps({"b": 1, "a": {1: ["x"], 0: ["y"]}}) == b'{"a":{"0":["y"],"1":["x"]},"b":1}'
+
+
+def test_dumps_without_orjson(monkeypatch):
+    monkeypatch.setattr(response, "orjson", None)
+    assert dumps({"b": 1, "a": {1: ["x"]}}) == b'{"a":{"1":["x"]},"b":1}'
+
+
+def test_validation_errors_of_list_items(client, user):
+    tokens = login(client, *user)
+    reply = client.post(
+        "/auth/introspect",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        json={"tokens": [123]},
+    )
+    assert reply.status_code == 400
+    body = json.loads(reply.data)
+    assert body["error"]["errors"] == {"tokens": {"0": ["Not a valid string."]}}
@@ -0,0 +1,87 @@
+import threading
+import time
+import uuid
+
+import pytest
+import redis
+from flask import Flask
+from flask_jwt_extended import JWTManager
+
+from common import cache as cache_module
+from common.cache import ResponseCache
+
+
+@pytest.fixture
+def cached_app(app):
+    """App with a cached view counting its calls, on the Redis of the session app"""
+    cached_app = Flask(__name__)
+    cached_app.config["RESPONSE_CACHE_PREFIX"] = f"test-{uuid.uuid4().hex}"
+    # the entries are keyed on the JWT identity
+    JWTManager(cached_app)
+    cache = ResponseCache(cached_app)
+    calls = []
+
+    @cached_app.route("/items")
+    @cache.cached(tags=("items",))
+    def items():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"calls": len(calls)}
+
+    @cached_app.route("/missing")
+    @cache.cached(tags=("items",))
+    def missing():
+        calls.append(1)
+        return {"message": "not found"}, 404
+
+    cached_app.cache = cache
+    cached_app.calls = calls
+    return cached_app
+
+
+def test_second_request_is_served_from_the_cache(cached_app):
+    client = cached_app.test_client()
+    assert client.get("/items").get_json() == {"calls": 1}
+    assert client.get("/items").get_json() == {"calls": 1}
+    assert len(cached_app.calls) == 1
+
+
+def test_invalidate_drops_the_tagged_entries(cached_app):
+    client = cached_app.test_client()
+    client.get("/items")
+    with cached_app.app_context():
+        cached_app.cache.invalidate("items")
+    assert client.get("/items").get_json() == {"calls": 2}
+
+
+def test_concurrent_misses_call_the_view_once(cached_app):
+    replies = []
+
+    def get():
+        replies.append(cached_app.test_client().get("/items").get_json())
+
+    threads = [threading.Thread(target=get) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(cached_app.calls) == 1
+    assert replies == [{"calls": 1}] * 10
+
+
+def test_errors_are_not_cached(cached_app):
+    client = cached_app.test_client()
+    assert client.get("/missing").status_code == 404
+    assert client.get("/missing").status_code == 404
+    assert len(cached_app.calls) == 2
+
+
+def test_redis_errors_bypass_the_cache(cached_app, monkeypatch):
+    def unavailable():
+        raise redis.ConnectionError("down")
+
+    monkeypatch.setattr(cache_module, "connect_with_redis", unavailable)
+    client = cached_app.test_client()
+    assert client.get("/items").status_code == 200
+    assert client.get("/items").status_code == 200
+    assert len(cached_app.calls) == 2
@@ -0,0 +1,57 @@
+import time
+
+from tests.conftest import login
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def change_password(client, tokens, current_password, new_password):
+    from flask_jwt_extended import decode_token
+
+    with client.application.app_context():
+        user_id = decode_token(tokens["access_token"])["identity"]["id"]
+    return client.put(
+        "/auth/change_password",
+        headers=bearer(tokens["access_token"]),
+        json={
+            "user_id": user_id,
+            "current_password": current_password,
+            "new_password": new_password,
+            "confirm_password": new_password,
+        },
+    )
+
+
+def is_accepted(client, token):
+    response = client.post(
+        "/auth/introspect", headers=bearer(token), json={"tokens": [token]}
+    )
+    return response.status_code == 200
+
+
+def test_login_right_after_change_password(client, user):
+    username, password = user
+    old = login(client, username, password)
+    # tokens issued in an earlier second than the change are revoked
+    time.sleep(1.1)
+    assert change_password(client, old, password, "new-pw").status_code == 200
+
+    new = login(client, username, "new-pw")
+    assert is_accepted(client, new["access_token"])
+    assert not is_accepted(client, old["access_token"])
+
+
+def test_revoke_access_in_bucket_storage(app, client, user):
+    app.config["REDIS_REVOCATION_STORAGE"] = "buckets"
+    app.config["REVOCATION_CACHE_ENABLED"] = False
+    try:
+        tokens = login(client, *user)
+        reply = client.delete("/auth/revoke_access", headers=bearer(tokens["access_token"]))
+        assert reply.status_code == 200
+        assert not is_accepted(client, tokens["access_token"])
+        assert is_accepted(client, login(client, *user)["access_token"])
+    finally:
+        app.config["REDIS_REVOCATION_STORAGE"] = "keys"
+        app.config["REVOCATION_CACHE_ENABLED"] = True
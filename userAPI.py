@@ -1,9 +1,9 @@
+from flask import Blueprint
 from flask.views import MethodView
 
-from app import name_space
+blueprint = Blueprint("users", __name__, url_prefix="/users")
 
 
-@name_space.route("/")
 class UserAPI(MethodView):
     
     def get(self):
@@ -63,3 +63,6 @@ class UserAPI(MethodView):
     #         description: User created
     #     """
     #     return {}
+
+
+blueprint.add_url_rule("/", view_func=UserAPI.as_view("user_api"))
@@ -0,0 +1,15 @@
+"""WSGI entry point, meant to be preloaded by the gunicorn master
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import gc
+import os
+
+from app import create_app
+
+# never fall back to the development settings (DEBUG, default SECRET_KEY) in a deployment
+app = create_app(os.getenv("FLASK_CONFIG") or os.getenv("FLASK_ENV") or "production")
+
+# everything allocated while booting moves to the permanent generation: the collector in
+# the forked workers then never touches, and so never copies, those shared pages
+gc.freeze()